@@ -0,0 +1,116 @@
+"""
+Recall versus latency of the compact embedding formats against the full-precision search.
+
+Every format searches candidates on truncated and/or quantized vectors and rescores them
+exactly; recall@k is measured against the exact float32 search over the full vectors.
+
+    python -m benchmarks.embedding_recall --columns 100000
+    python -m benchmarks.embedding_recall --snapshot .cache/column_index/<fingerprint>
+
+A snapshot of the real catalog gives meaningful numbers for truncation: text-embedding-3
+vectors are trained so their leading dimensions carry most of the signal, the synthetic
+bag-of-tokens vectors are not.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.fakes import generate_catalog
+from benchmarks.run_benchmarks import _percentile, git_commit
+from embedding_format import EmbeddingFormat, vector_literal
+from local_index import LocalVectorIndex
+
+DEFAULT_FORMATS = ["full:float16", "full:int8", "512:float32", "512:float16", "256:float32", "256:float16", "256:int8"]
+
+def parse_format(spec: str, candidates: int) -> EmbeddingFormat:
+    dimensions, _, precision = spec.partition(":")
+    return EmbeddingFormat(None if dimensions == "full" else int(dimensions), precision or "float32", candidates)
+
+def make_queries(matrix: np.ndarray, n_queries: int, noise: float, seed: int) -> np.ndarray:
+    """Perturbs random catalog vectors so the nearest neighbours are not trivially the vectors themselves."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(matrix), size=min(n_queries, len(matrix)), replace=False)
+    queries = np.asarray(matrix[rows], dtype=np.float32)
+    queries = queries + noise * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def run_format(embedding_format: EmbeddingFormat, catalog: dict, queries: np.ndarray, k: int, exact: list) -> dict:
+    index = LocalVectorIndex(embedding_format=embedding_format)
+    index.load_rows(catalog["column_names"], catalog["descriptions"], catalog["keywords"], catalog["embeddings"])
+    snapshot = index._snapshot
+    durations, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ranked = index._top_k(snapshot, [query], None, k)[0]
+        durations.append(time.perf_counter() - start)
+        results.append([row for row, _ in ranked])
+    durations.sort()
+    recall = np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, exact)]) if exact else 1.0
+    compact = snapshot.compact if snapshot.compact is not None else snapshot.matrix
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(_percentile(durations, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(durations, 0.99) * 1000, 3),
+        "search_matrix_bytes": int(compact.nbytes),
+    }, results
+
+def literal_report(vector: np.ndarray, runs: int = 200) -> dict:
+    """Compares the old str(list) query parameter with vector_literal."""
+    values = vector.astype(np.float64).tolist()
+    start = time.perf_counter()
+    for _ in range(runs):
+        old = str(values)
+    old_ms = (time.perf_counter() - start) / runs * 1000
+    start = time.perf_counter()
+    for _ in range(runs):
+        new = vector_literal(vector)
+    new_ms = (time.perf_counter() - start) / runs * 1000
+    return {"str_list_ms": round(old_ms, 4), "str_list_chars": len(old),
+            "vector_literal_ms": round(new_ms, 4), "vector_literal_chars": len(new)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall and latency of the compact embedding formats.")
+    parser.add_argument("--columns", type=int, default=20000, help="Synthetic catalog size.")
+    parser.add_argument("--snapshot", help="A local index snapshot directory to take real embeddings from.")
+    parser.add_argument("--formats", nargs="+", default=DEFAULT_FORMATS, help="Formats as dimensions:precision.")
+    parser.add_argument("--candidates", type=int, default=100, help="Rows rescored exactly per query.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="Relative noise added to the sampled query vectors.")
+    parser.add_argument("-k", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="embedding_recall.json")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        embeddings = np.load(f"{args.snapshot}/embeddings.npy")
+        with open(f"{args.snapshot}/metadata.json") as f:
+            metadata = json.load(f)
+        catalog = {**metadata, "embeddings": embeddings}
+    else:
+        catalog = generate_catalog(args.columns, seed=args.seed)
+    queries = make_queries(catalog["embeddings"], args.queries, args.noise, args.seed)
+
+    report = {
+        "commit": git_commit(),
+        "config": vars(args),
+        "columns": len(catalog["column_names"]),
+        "query_literal": literal_report(queries[0]),
+        "formats": {},
+    }
+    report["formats"]["full:float32"], exact = run_format(EmbeddingFormat(), catalog, queries, args.k, None)
+    for spec in args.formats:
+        report["formats"][spec], _ = run_format(parse_format(spec, args.candidates), catalog, queries, args.k, exact)
+
+    print(f"{report['columns']} columns, {len(queries)} queries, recall@{args.k} against full:float32")
+    for spec, stats in report["formats"].items():
+        print(f"{spec:<14} recall {stats['recall_at_k']:.4f}  p50 {stats['p50_ms']:>9.3f} ms  "
+              f"p99 {stats['p99_ms']:>9.3f} ms  {stats['search_matrix_bytes'] / 2 ** 20:>8.1f} MiB")
+    print(f"query literal: {report['query_literal']}")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
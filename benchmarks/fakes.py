@@ -0,0 +1,117 @@
+"""
+Local stand-ins for the services the search pipeline talks to, so it can be
+benchmarked without OpenAI or PostgreSQL credentials.
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from types import SimpleNamespace
+
+import numpy as np
+
+from helpers.extract_keywords import extract_unique_words_advanced
+from retrieval import ALL_COLUMNS
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+@lru_cache(maxsize=200000)
+def _token_vector(token: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(token.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+def fake_embedding(text: str, dimensions: int = 1536) -> np.ndarray:
+    """
+    A deterministic bag-of-tokens embedding: the sum of one fixed random vector per token.
+    Texts sharing words end up close together, which keeps the rankings meaningful.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in TOKEN.findall(text.lower()):
+        vector += _token_vector(token, dimensions)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class FakeOpenAI:
+    """
+    Mimics the parts of openai.OpenAI used by retrieval.py: chat completions (plain and
+    streamed) and embeddings. Latencies are configurable and all outputs are deterministic.
+    chat_latency is the time to the first token and token_latency the time per streamed chunk.
+    """
+    def __init__(self, column_names: list[str], chat_latency: float = 0.8, token_latency: float = 0.01,
+                 embedding_latency: float = 0.1, dimensions: int = 1536, descriptions_per_query: int = 6):
+        self.column_names = column_names
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.embedding_latency = embedding_latency
+        self.dimensions = dimensions
+        self.descriptions_per_query = descriptions_per_query
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embeddings)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.calls[name] += amount
+
+    def _completion_text(self, prompt: str) -> str:
+        user_input = prompt.split("user_input :")[-1].split("\n")[0].strip()
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        columns = rng.sample(self.column_names, min(self.descriptions_per_query, len(self.column_names)))
+        return "\n\n".join(
+            f"The column {column} of type CharField in categorical labels describes {column.replace('_', ' ')} "
+            f"values relevant to {user_input}, encompassing domain terminology and its relationship to related columns."
+            for column in columns
+        )
+
+    def _create_completion(self, model: str, messages: list[dict], temperature: float = 0, stream: bool = False, **kwargs):
+        self._count("chat.completions")
+        text = self._completion_text(messages[-1]["content"])
+        if stream:
+            return self._stream(text)
+        time.sleep(self.chat_latency + self.token_latency * (len(text) // 16))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+    def _stream(self, text: str):
+        time.sleep(self.chat_latency)
+        for start in range(0, len(text), 16):
+            time.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[start:start + 16]))])
+
+    def _create_embeddings(self, model: str, input, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self._count("embeddings")
+        self._count("embedded_texts", len(texts))
+        time.sleep(self.embedding_latency)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_embedding(text, self.dimensions).tolist())
+            for i, text in enumerate(texts)
+        ])
+
+def generate_catalog(n_columns: int, dimensions: int = 1536, seed: int = 0) -> dict:
+    """
+    Builds a synthetic column catalog of n_columns rows by cycling through ALL_COLUMNS and
+    suffixing the names, with keywords extracted the way the real catalog builds them.
+    """
+    rng = random.Random(seed)
+    parsed = [column.split(" - ", 2) for column in ALL_COLUMNS]
+    vocabulary = sorted({word for _, _, sample in parsed for word in TOKEN.findall(sample.lower()) if len(word) > 3})
+
+    column_names, descriptions, keywords = [], [], []
+    for i in range(n_columns):
+        name, data_type, sample = parsed[i % len(parsed)]
+        if i >= len(parsed):
+            name = f"{name}_{rng.choice(vocabulary)}_{i // len(parsed)}"
+        description = (
+            f"The column {name} of type {data_type} stores {name.replace('_', ' ')} values such as "
+            f"{sample[:120].strip(chr(39))}"
+        )
+        column_names.append(name)
+        descriptions.append(description)
+        keywords.append(sorted(extract_unique_words_advanced([name, sample])))
+
+    embeddings = np.vstack([fake_embedding(description, dimensions) for description in descriptions])
+    return {"column_names": column_names, "descriptions": descriptions, "keywords": keywords, "embeddings": embeddings}
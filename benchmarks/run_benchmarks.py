@@ -0,0 +1,250 @@
+"""
+Offline benchmarks for the search pipeline.
+
+Drives the real stage functions (retrieval.py, metadata_filter.py, search_pipeline.py and
+the helpers) against a fake OpenAI client, an in-memory stand-in for pgvector (or a local
+pgvector catalog given with --db-url) and synthetic catalogs of increasing size.
+
+    python -m benchmarks.run_benchmarks --scales 40 1000 100000 --output results.json
+    python -m benchmarks.run_benchmarks --baseline results.json --fail-on-regression
+
+The results file holds the commit, the configuration and per-stage throughput and
+p50/p99 latencies, so runs on different commits can be compared with --baseline.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import retrieval
+from benchmarks.fakes import FakeOpenAI, generate_catalog
+from fusion import fuse_results
+from helpers.extract_keywords import ColumnProfiler, extract_unique_words_advanced as extract_catalog_keywords
+from helpers.pre_process_data import pre_process_sample
+from local_index import LocalVectorIndex
+from search_pipeline import run_search_pipeline, run_streaming_search_pipeline
+
+QUERIES = [
+    "companies offering GMP certified sterile manufacturing",
+    "where is the company located",
+    "which molecule types does the company work with",
+    "contract research organizations founded before 2000",
+    "ISO certified clean room facilities",
+    "number of employees of public companies",
+    "clinical trial phase of development",
+    "analytical equipment like NMR and chromatography",
+    "oral and injectable routes of administration",
+    "rare disease therapeutic focus",
+]
+
+def measure(func, runs: int, items: int = 1) -> dict:
+    """Calls func runs times and returns its latency percentiles in milliseconds and its throughput."""
+    durations = []
+    for i in range(runs):
+        start = time.perf_counter()
+        func(i)
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    total = sum(durations)
+    return {
+        "runs": runs,
+        "p50_ms": round(_percentile(durations, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(durations, 0.99) * 1000, 3),
+        "mean_ms": round(total / runs * 1000, 3),
+        "throughput_per_s": round(runs * items / total, 2) if total else None,
+    }
+
+def _percentile(sorted_samples: list[float], quantile: float) -> float:
+    index = min(len(sorted_samples) - 1, max(0, round(quantile * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def keyword_expander():
+    """Returns metadata_filter's keyword expansion, or the reason it cannot run here."""
+    try:
+        import metadata_filter
+        metadata_filter.get_wordnet().synsets("test")
+    except LookupError:
+        return None, "the NLTK WordNet corpora are not installed"
+    return metadata_filter, None
+
+def local_searcher(catalog: dict):
+    index = LocalVectorIndex()
+    index.load_rows(catalog["column_names"], catalog["descriptions"], catalog["keywords"], catalog["embeddings"])
+    return index.hybrid_search
+
+def pgvector_searcher(db_url: str):
+    """Searches an existing, already populated public.column_embeddings table. Nothing is written."""
+    from db_pool import ConnectionPool
+    pool = ConnectionPool(db_url, minconn=1, maxconn=8)
+
+    def search(embeddings, user_keywords):
+        with pool.connection() as conn:
+            return retrieval.hybrid_search(embeddings, user_keywords, conn)
+    return search
+
+def bench_scale(n_columns: int, args, expander) -> dict:
+    """Benchmarks every pipeline stage and the whole pipeline against one catalog size."""
+    started = time.perf_counter()
+    catalog = generate_catalog(n_columns, dimensions=args.dim, seed=args.seed)
+    client = FakeOpenAI(
+        catalog["column_names"], chat_latency=args.chat_latency, token_latency=args.token_latency,
+        embedding_latency=args.embedding_latency, dimensions=args.dim,
+    )
+    search = pgvector_searcher(args.db_url) if args.db_url else local_searcher(catalog)
+    stages = {"catalog_build_s": round(time.perf_counter() - started, 3)}
+
+    def extract_keywords(text):
+        if expander is None:
+            return sorted(extract_catalog_keywords([text]))
+        return expander.extract_unique_words_advanced([text])
+
+    query = lambda i: QUERIES[i % len(QUERIES)]
+    keywords = {q: extract_keywords(q) for q in QUERIES}
+    descriptions = {q: retrieval.reformulate_for_query(q, client) for q in QUERIES}
+    embeddings = {q: retrieval.get_embeddings(descriptions[q], client) for q in QUERIES}
+    results = {q: search(embeddings[q], keywords[q]) for q in QUERIES}
+
+    if expander is not None:
+        def expand_cold(i):
+            expander.expand_token.cache_clear()
+            expander.extract_unique_words_advanced([query(i)])
+        stages["keyword_expansion"] = measure(expand_cold, args.runs)
+        stages["keyword_expansion_cached"] = measure(lambda i: expander.extract_unique_words_advanced([query(i)]), args.runs)
+    stages["reformulate"] = measure(lambda i: retrieval.reformulate_for_query(query(i), client), args.llm_runs)
+    stages["reformulate_first_description"] = measure(
+        lambda i: next(retrieval.stream_reformulation(query(i), client)), args.llm_runs
+    )
+    stages["embed"] = measure(lambda i: retrieval.get_embeddings(descriptions[query(i)], client), args.runs,
+                              items=client.descriptions_per_query)
+    stages["search"] = measure(lambda i: search(embeddings[query(i)], keywords[query(i)]), args.runs,
+                               items=client.descriptions_per_query)
+    stages["fuse_rrf"] = measure(lambda i: fuse_results(results[query(i)], method="rrf"), args.runs)
+    stages["fuse_distance"] = measure(lambda i: fuse_results(results[query(i)], method="distance"), args.runs)
+
+    def end_to_end(i):
+        _, _, results_lists = run_search_pipeline(
+            query(i), extract_keywords,
+            reformulate=lambda q: retrieval.reformulate_for_query(q, client),
+            embed=lambda texts: retrieval.get_embeddings(texts, client),
+            search=search,
+        )
+        fuse_results(results_lists)
+    stages["end_to_end"] = measure(end_to_end, args.llm_runs)
+
+    def end_to_end_streaming(i):
+        _, _, results_lists = run_streaming_search_pipeline(
+            query(i), extract_keywords,
+            stream_descriptions=lambda q: retrieval.stream_reformulation(q, client),
+            embed=lambda texts: retrieval.get_embeddings(texts, client),
+            search=search,
+        )
+        fuse_results(results_lists)
+    stages["end_to_end_streaming"] = measure(end_to_end_streaming, args.llm_runs)
+    stages["openai_calls"] = dict(client.calls)
+    return stages
+
+def bench_helpers(args) -> dict:
+    """Benchmarks the catalog profiling helpers on large lists of sample values."""
+    rng = random.Random(args.seed)
+    words = [w for column in retrieval.ALL_COLUMNS for w in column.split(" - ", 2)[2].strip("'").split("\\n") if w]
+    text_samples = [rng.choice(words) for _ in range(args.sample_size)]
+    numeric_samples = [rng.randrange(1, 10 ** 6) for _ in range(args.sample_size)]
+    numeric_strings = [str(value) for value in numeric_samples]
+    return {
+        "sample_size": args.sample_size,
+        "extract_unique_words_advanced_text": measure(lambda i: extract_catalog_keywords(text_samples), args.helper_runs, args.sample_size),
+        "extract_unique_words_advanced_numeric": measure(lambda i: extract_catalog_keywords(numeric_strings), args.helper_runs, args.sample_size),
+        "column_profiler_text": measure(lambda i: ColumnProfiler().consume(text_samples), args.helper_runs, args.sample_size),
+        "column_profiler_numeric_strings": measure(lambda i: ColumnProfiler().consume(numeric_strings), args.helper_runs, args.sample_size),
+        "pre_process_sample_text": measure(lambda i: pre_process_sample(text_samples), args.helper_runs, args.sample_size),
+        "pre_process_sample_numeric_strings": measure(lambda i: pre_process_sample(numeric_strings), args.helper_runs, args.sample_size),
+        "pre_process_sample_numeric": measure(lambda i: pre_process_sample(numeric_samples), args.helper_runs, args.sample_size),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Returns one line per stage whose p50 got slower than the baseline by more than tolerance."""
+    regressions = []
+    sections = [(f"scale {scale}", stages, baseline.get("scales", {}).get(scale, {})) for scale, stages in current["scales"].items()]
+    if baseline.get("helpers", {}).get("sample_size") == current["helpers"]["sample_size"]:
+        sections.append(("helpers", current["helpers"], baseline["helpers"]))
+    for section, stages, baseline_stages in sections:
+        for stage, stats in stages.items():
+            before = baseline_stages.get(stage)
+            if not isinstance(stats, dict) or not isinstance(before, dict) or not before.get("p50_ms"):
+                continue
+            ratio = stats["p50_ms"] / before["p50_ms"]
+            print(f"{section:>12} {stage:<40} p50 {before['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms ({ratio:.2f}x)")
+            if ratio > 1 + tolerance:
+                regressions.append(f"{section} {stage}: p50 {before['p50_ms']} -> {stats['p50_ms']} ms")
+    return regressions
+
+def print_table(name: str, stages: dict) -> None:
+    print(f"\n== {name}")
+    for stage, stats in stages.items():
+        if isinstance(stats, dict) and "p50_ms" in stats:
+            print(f"{stage:<40} p50 {stats['p50_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms  "
+                  f"{stats['throughput_per_s']:>12} /s")
+        else:
+            print(f"{stage:<40} {stats}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search pipeline offline.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[40, 1000, 10000, 100000], help="Catalog sizes in columns.")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions.")
+    parser.add_argument("--runs", type=int, default=50, help="Runs per local stage.")
+    parser.add_argument("--llm-runs", type=int, default=10, help="Runs per stage that waits on the fake OpenAI latency.")
+    parser.add_argument("--chat-latency", type=float, default=0.8, help="Fake time to the first completion token, in seconds.")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Fake time per streamed completion chunk, in seconds.")
+    parser.add_argument("--embedding-latency", type=float, default=0.1, help="Fake latency of one embeddings call, in seconds.")
+    parser.add_argument("--sample-size", type=int, default=100000, help="Sample values per helper benchmark.")
+    parser.add_argument("--helper-runs", type=int, default=5, help="Runs per helper benchmark.")
+    parser.add_argument("--db-url", help="Search this local pgvector catalog instead of the in-memory stand-in.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", help="A previous results file to compare the p50 latencies with.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed p50 slowdown against the baseline.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 when a stage regressed.")
+    args = parser.parse_args()
+
+    expander, skipped = keyword_expander()
+    if skipped:
+        print(f"Skipping keyword_expansion: {skipped}", file=sys.stderr)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "skipped": {"keyword_expansion": skipped} if skipped else {},
+        "scales": {},
+    }
+    for n_columns in args.scales:
+        results["scales"][str(n_columns)] = bench_scale(n_columns, args, expander)
+        print_table(f"{n_columns} columns", results["scales"][str(n_columns)])
+    results["helpers"] = bench_helpers(args)
+    print_table("helpers", results["helpers"])
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import threading
+import time
+
+class CachedResource:
+    """
+    Holds one copy of something built from the database per process, and rebuilds it
+    every refresh_interval seconds or after invalidate(). Only one thread rebuilds at a
+    time; the others keep getting the current copy.
+
+    The connect argument of get() here, and of the refresh methods of LocalVectorIndex
+    and ResultCache, is a callable returning a connection context manager, such as
+    ConnectionPool.connection. It is only called when the database has to be read.
+    """
+    def __init__(self, build, refresh_interval: float):
+        self.build = build
+        self.refresh_interval = refresh_interval
+        self._value = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _is_stale(self) -> bool:
+        return self._value is None or time.monotonic() - self._built_at >= self.refresh_interval
+
+    def get(self, connect):
+        """Returns the current copy, building it over a connection from connect() first if it is stale."""
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    with connect() as conn:
+                        self._value = self.build(conn)
+                    self._built_at = time.monotonic()
+        return self._value
+
+    def invalidate(self) -> None:
+        """Makes the next get() rebuild the copy, waiting for a rebuild in progress to finish first."""
+        with self._lock:
+            self._built_at = float("-inf")
@@ -0,0 +1,143 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of PostgreSQL connections.
+    Callers wait for a free connection instead of failing when the pool is
+    exhausted, every connection is health checked before it is handed out and
+    connections older than max_lifetime are recycled. Returned connections are
+    kept for reuse, so at most maxconn connections are ever open at once.
+    """
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 10,
+                 max_lifetime: float = 1800, checkout_timeout: float = 30):
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self.max_lifetime = max_lifetime
+        self.checkout_timeout = checkout_timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # Birth time of every open connection, keyed by the connection itself so ids are never reused
+        self._born = {}
+        self._idle = []
+        self._closed = False
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+        for _ in range(min(minconn, maxconn)):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        with self._lock:
+            self._born[conn] = time.monotonic()
+            self._created += 1
+        return conn
+
+    def _discard(self, conn, recycled: bool = True) -> None:
+        """Closes a connection and forgets it."""
+        with self._lock:
+            if self._born.pop(conn, None) is not None and recycled:
+                self._recycled += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn) -> bool:
+        """Pre-ping: checks that the connection is open, young enough and answering."""
+        if conn.closed:
+            return False
+        born = self._born.get(conn)
+        if born is None or time.monotonic() - born > self.max_lifetime:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        """Returns the most recently used healthy idle connection, or a new one."""
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """Yields a healthy connection and always returns it to the pool."""
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=self.checkout_timeout)
+        with self._lock:
+            self._waiting -= 1
+        if not acquired:
+            raise pool.PoolError(f"no database connection became free within {self.checkout_timeout}s")
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._reset(conn)
+            self._release(conn)
+            self._slots.release()
+
+    def _release(self, conn) -> None:
+        """Keeps a returned connection for reuse, unless it is closed or the pool is."""
+        with self._lock:
+            keep = not conn.closed and not self._closed and conn in self._born
+            if keep:
+                self._idle.append(conn)
+        if not keep:
+            self._discard(conn)
+
+    def _reset(self, conn) -> None:
+        """Ends any transaction left open by the caller, closing the connection if that fails."""
+        if conn.closed or conn.status == psycopg2.extensions.STATUS_READY:
+            return
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+
+    def stats(self) -> dict:
+        """Returns the current pool usage counters."""
+        with self._lock:
+            return {
+                "max_size": self.maxconn,
+                "open": len(self._born),
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "created": self._created,
+                "recycled": self._recycled,
+            }
+
+    def close(self) -> None:
+        """Closes the idle connections; connections in use are closed when they are returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn, recycled=False)
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+import time
+
+class DiskCache:
+    """
+    A size-bounded key/value store backed by a SQLite file.
+    The file is shared by every process that opens the same path, so Streamlit
+    workers and restarts all see the same entries. Least recently used entries
+    are evicted once the store grows past max_entries, and entries older than
+    ttl seconds are treated as missing when a ttl is set.
+    """
+    def __init__(self, path: str, table: str = "cache", max_entries: int = 50000, ttl: float = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({self.table})")]
+            if "expires_at" not in columns:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN expires_at REAL")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table} (last_used)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expires_at ON {self.table} (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening it in WAL mode on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Returns a dictionary of the stored values for the keys that are present."""
+        if not keys:
+            return {}
+        conn = self._connect()
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) "
+                f"AND (expires_at IS NULL OR expires_at > ?)", [*chunk, time.time()]
+            ).fetchall()
+            found.update(rows)
+        if found:
+            with conn:
+                conn.executemany(
+                    f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key in found],
+                )
+        return found
+
+    def set_many(self, items: dict) -> None:
+        """Stores the given key/value pairs, dropping expired entries and the oldest ones above max_entries."""
+        if not items:
+            return
+        conn = self._connect()
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, last_used, expires_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now, expires_at) for key, value in items.items()],
+            )
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            conn.execute(f"""
+                DELETE FROM {self.table}
+                WHERE key IN (
+                    SELECT key FROM {self.table}
+                    ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def set(self, key: str, value) -> None:
+        self.set_many({key: value})
+
+    def __len__(self) -> int:
+        return self._connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
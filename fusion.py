@@ -0,0 +1,65 @@
+import heapq
+
+FUSION_METHODS = ("rrf", "distance")
+
+def fuse_results(results_lists: list[list[tuple]], limit: int = 15, method: str = "rrf", weights: list[float] = None,
+                 keyword_weight: float = 1.0, rrf_k: int = 60) -> list[tuple]:
+    """
+    Merges the ranked lists of every description into one ranking in a single pass.
+    Each input row is (column_name, description, rank, distance, match_count, matched_keywords).
+
+    method "rrf" scores a column by weighted reciprocal rank fusion, sum(weight / (rrf_k + rank)),
+    with the keyword match count ranking fused in as one more list weighted by keyword_weight.
+    method "distance" sums the weighted similarities min-max normalized within each list, plus
+    keyword_weight times the match count relative to the best match count.
+
+    weights holds one weight per list (1.0 each by default). Returns at most limit rows of
+    (column_name, description, best_rank, min_distance, match_count, matched_keywords, score),
+    highest score first.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method {method!r}, expected one of {FUSION_METHODS}")
+    if weights is None:
+        weights = [1.0] * len(results_lists)
+
+    # column_name -> [score, best_rank, min_distance, description, match_count, matched_keywords]
+    fused = {}
+    for result_list, weight in zip(results_lists, weights):
+        if not result_list:
+            continue
+        if method == "distance":
+            distances = [row[3] for row in result_list]
+            nearest, farthest = min(distances), max(distances)
+            spread = farthest - nearest
+        for position, (column_name, description, rank, distance, match_count, matched_keywords) in enumerate(result_list, 1):
+            rank = rank or position
+            if method == "rrf":
+                score = weight / (rrf_k + rank)
+            else:
+                score = weight * ((farthest - distance) / spread if spread else 1.0)
+            entry = fused.get(column_name)
+            if entry is None:
+                fused[column_name] = [score, rank, distance, description, match_count, matched_keywords]
+            else:
+                entry[0] += score
+                entry[1] = min(entry[1], rank)
+                entry[2] = min(entry[2], distance)
+
+    if keyword_weight and fused:
+        best_count = max(entry[4] for entry in fused.values())
+        if best_count > 0:
+            if method == "rrf":
+                # Columns with the same match count share a keyword rank
+                keyword_ranks = {count: rank for rank, count in enumerate(sorted({e[4] for e in fused.values()}, reverse=True), 1)}
+                for entry in fused.values():
+                    if entry[4] > 0:
+                        entry[0] += keyword_weight / (rrf_k + keyword_ranks[entry[4]])
+            else:
+                for entry in fused.values():
+                    entry[0] += keyword_weight * entry[4] / best_count
+
+    top = heapq.nsmallest(limit, fused.items(), key=lambda item: (-item[1][0], item[1][1], item[0]))
+    return [
+        (column_name, description, best_rank, min_distance, match_count, matched_keywords, score)
+        for column_name, (score, best_rank, min_distance, description, match_count, matched_keywords) in top
+    ]
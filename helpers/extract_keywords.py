@@ -1,7 +1,18 @@
+import heapq
 import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 
+import numpy as np
+
+DELIMITERS = re.compile(r'[\x20-\x2F\x39-\x40\x5B-\x60\x7B-\x7E]+')
+# A superset of the strings float() accepts, so most text is rejected without calling float()
+NUMERIC = re.compile(r'\s*[-+]?(?:(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][-+]?\d+)?|nan|inf|infinity)\s*', re.IGNORECASE)
+
 def is_numeric_string(s):
     """Checks if a string can be converted to a float."""
     if not isinstance(s, str):
@@ -11,7 +22,32 @@ def is_numeric_string(s):
         return True
     except (ValueError, TypeError):
         return False
-    
+
+def text_mask(values) -> np.ndarray:
+    """
+    Flags the values that are non-numeric, non-blank strings, for a whole chunk at once.
+    A chunk of numeric strings is converted in one vectorized pass; only mixed chunks
+    fall back to the precompiled numeric pattern per item.
+    """
+    is_string = np.fromiter((isinstance(item, str) for item in values), dtype=bool, count=len(values))
+    if not is_string.any():
+        return is_string
+    strings = [item for item, flag in zip(values, is_string) if flag]
+    try:
+        # An object array converts with float() itself, in one C loop
+        np.array(strings, dtype=object).astype(np.float64)
+        numeric = np.ones(len(strings), dtype=bool)
+    except ValueError:
+        numeric = np.fromiter((not item.strip() or (NUMERIC.fullmatch(item) is not None and is_numeric_string(item))
+                               for item in strings), dtype=bool, count=len(strings))
+    mask = is_string.copy()
+    mask[is_string] = ~numeric
+    return mask
+
+def valid_mask(values) -> np.ndarray:
+    """Flags the values that are neither None nor blank."""
+    return np.fromiter((item is not None and str(item).strip() != '' for item in values), dtype=bool, count=len(values))
+
 def is_text_data(data_list, threshold=0.5):
     """
     Checks if a list contains a majority of true non-numeric text data,
@@ -19,55 +55,127 @@ def is_text_data(data_list, threshold=0.5):
     """
     if not data_list:
         return False
-
-    text_item_count = 0
-    valid_items = 0
-    
-    for item in data_list:
-        if item is not None and str(item).strip() != '':
-            valid_items += 1
-            if isinstance(item, str) and not is_numeric_string(item):
-                text_item_count += 1
-    
+    data_list = list(data_list)
+    valid_items = int(valid_mask(data_list).sum())
     if valid_items == 0:
         return False
+    return int(text_mask(data_list).sum()) / valid_items > threshold
 
-    return (text_item_count / valid_items) > threshold
+@lru_cache(maxsize=65536)
+def item_keywords(item: str) -> tuple:
+    """Tokenizes one sample item into its keywords. Cached, since column values repeat heavily."""
+    keywords = []
+    for token in DELIMITERS.sub(' ', item).split():
+        token_lower = token.lower()
+        if token_lower.startswith('http'): #edge case for URLs
+            try:
+                domain_parts = urlparse(token_lower).netloc.split('.')
+            except ValueError:
+                continue
+            domain_name = domain_parts[1] if len(domain_parts) > 1 and domain_parts[0] == 'www' else domain_parts[0]
+            if domain_name:
+                keywords.append(domain_name)
+        else:
+            clean_word = token_lower.strip('.,!?:;')
+            if clean_word:
+                keywords.append(clean_word)
+    return tuple(keywords)
 
 def extract_unique_words_advanced(sample_data):
     """
     Processes sample_data or the column name to extract unique keywords.
     """
+    sample_data = list(sample_data)
     unique_words_set = set()
-    delimiters = r'[\x20-\x2F\x39-\x40\x5B-\x60\x7B-\x7E]+'
-
-    for item in sample_data:
-        if isinstance(item, str) and not is_numeric_string(item): #only performs the keywords extraction if the sample item is non numeric.
-            cleaned_string = re.sub(delimiters, ' ', item)
-            tokens = cleaned_string.strip().split()
-
-            for token in tokens:
-                token_lower = token.lower()
-                if token_lower.startswith('http'): #edge case for URLs
-                    try:
-                        parsed_url = urlparse(token_lower)
-                        netloc = parsed_url.netloc
-                        domain_parts = netloc.split('.')
-                        if len(domain_parts) > 1 and domain_parts[0] == 'www':
-                            domain_name = domain_parts[1]
-                        else:
-                            domain_name = domain_parts[0]
-                        if domain_name:
-                           unique_words_set.add(domain_name)
-                    except Exception:
-                        continue
-                else:
-                    clean_word = token_lower.strip('.,!?:;') 
-                    if clean_word:
-                        unique_words_set.add(clean_word)
-
+    for item, is_text in zip(sample_data, text_mask(sample_data)): #only performs the keywords extraction if the sample item is non numeric.
+        if is_text:
+            unique_words_set.update(item_keywords(item))
     return list(unique_words_set)
 
+def _sample_priority(value) -> int:
+    return zlib.crc32(str(value).encode("utf-8"))
+
+class ColumnProfiler:
+    """
+    Profiles a column from a stream of values in constant memory.
+    Values are consumed in chunks (e.g. from a server-side cursor). The profiler keeps
+    a sample of at most sample_size distinct values, the text/numeric counts and
+    approximate keyword frequencies.
+
+    The sample is a reservoir keyed by a stable hash of each value: the sample_size
+    values with the smallest hashes. That is a uniform sample of the distinct values,
+    and the same data gives the same sample whatever order the rows arrive in.
+
+    Keyword counts use the Misra-Gries summary: at most max_keywords counters are
+    kept, and every keyword more frequent than 1/max_keywords of the total is
+    guaranteed to be among them.
+    """
+    def __init__(self, sample_size: int = 200, max_keywords: int = 1000):
+        self.sample_size = sample_size
+        self.max_keywords = max_keywords
+        self.rows = 0
+        self.valid = 0
+        self.text = 0
+        self._sample = {}
+        self._keyword_counts = Counter()
+
+    def update(self, values) -> None:
+        """Adds one chunk of values."""
+        values = list(values)
+        if not values:
+            return
+        valid = valid_mask(values)
+        text = text_mask(values)
+        self.rows += len(values)
+        self.valid += int(valid.sum())
+        self.text += int(text.sum())
+        self._update_sample([value for value, flag in zip(values, valid) if flag])
+
+        chunk_counts = Counter()
+        for value, is_text in zip(values, text):
+            if is_text:
+                chunk_counts.update(item_keywords(value))
+        self._merge_keywords(chunk_counts)
+
+    def consume(self, values, chunk_size: int = 10000) -> "ColumnProfiler":
+        """Adds every value of an iterable, chunk_size values at a time."""
+        values = iter(values)
+        while chunk := list(islice(values, chunk_size)):
+            self.update(chunk)
+        return self
+
+    def _update_sample(self, values: list) -> None:
+        for value in values:
+            self._sample.setdefault(_sample_priority(value), value)
+        if len(self._sample) > self.sample_size:
+            priorities = np.fromiter(self._sample, dtype=np.int64, count=len(self._sample))
+            keep = np.partition(priorities, self.sample_size - 1)[self.sample_size - 1]
+            self._sample = {priority: value for priority, value in self._sample.items() if priority <= keep}
+
+    def _merge_keywords(self, chunk_counts: Counter) -> None:
+        self._keyword_counts.update(chunk_counts)
+        if len(self._keyword_counts) > self.max_keywords:
+            # Subtracting the (k+1)-th largest count from every counter keeps the Misra-Gries guarantee
+            threshold = heapq.nlargest(self.max_keywords + 1, self._keyword_counts.values())[-1]
+            self._keyword_counts = Counter({
+                keyword: count - threshold for keyword, count in self._keyword_counts.items() if count > threshold
+            })
+
+    def sample(self) -> list:
+        """The sampled distinct values, in a stable order."""
+        return [self._sample[priority] for priority in sorted(self._sample)]
+
+    def is_text(self, threshold: float = 0.5) -> bool:
+        """The is_text_data decision over every value seen."""
+        return self.valid > 0 and self.text / self.valid > threshold
+
+    def keyword_counts(self, top: int = None) -> list[tuple]:
+        """The (keyword, approximate count) pairs, most frequent first."""
+        return sorted(self._keyword_counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+    def keywords(self, top: int = None) -> list[str]:
+        return [keyword for keyword, _ in self.keyword_counts(top)]
+
 def main() :
     sample_data = ['Rare/Orphan Diseases', 'Bladder Cancer\nBlood/Coagulation Disorders\nBreast Cancer\nCancer\nCardiovascular Disorders\nCNS Disorders\nDermatology/Skin Diseases\nDiabetes\nEndocrine/Metabolic Disorders\nGastric Cancer\nGastrointestinal Diseases\nGenetic Disorders\nGenitourinary Diseases\nHematologic Diseases\nHematological Cancers\nInfectious Diseases\nInflammation/Immune\nKidney Diseases\nLeukemia\nLiver Diseases\nLung Cancer\nLymphoma\nMetastatic Cancers\nMultiple Myeloma\nMusculoskeletal Diseases\nNAFLD/NASH\nNeurodegenerative Diseases\nObesity\nOphthalmic Diseases\nOvarian Cancer\nPain Management\nPancreatic Cancer\nProstate Cancer\nRare/Orphan Diseases\nSarcoma Cancers\nSolid Cancers\nWomen`s/Prenatal Health', 'Acute Kidney Injury\nAllergy\nALS\nAnemia\nAnesthesia/Pain Control\nAnxiety\nAsthma\nBladder Cancer\nBlood/Coagulation Disorders\nBrain Cancer\nBreast Cancer\nCancer\nCardiovascular Disorders\nCNS Disorders\nColorectal Cancer\nDepression\nDermatology/Skin Diseases\nDiabetes\nDry Eye Syndrome\nEndocrine/Metabolic Disorders\nFibrotic Diseases\nGastric Cancer\nGastrointestinal Diseases\nGenitourinary Diseases\nHematological Cancers\nImmuno-Oncology\nImmunotherapy\nInflammation/Immune\nKidney Diseases\nLeukemia\nLiver Cancer\nLiver Diseases\nLiver Fibrosis\nLung Cancer\nLymphoma\nMelanoma\nMen`s Health\nMultiple Sclerosis\nNAFLD/NASH\nNeurodegenerative Diseases\nNewborn Health\nObesity\nOphthalmic Diseases\nOsteoarthritis\nOvarian Cancer\nPancreatic Cancer\nParkinson`s Disease\nPregnancy/Fertility\nPrenatal Heath\nPsychiatric Disorders\nRare/Orphan Diseases\nRenal/Kidney Cancer\nRespiratory Diseases\nRetinal Diseases\nRheumatoid Arthritis\nSchizophrenia\nSolid Cancers\nWomen`s/Prenatal Health', 'Anesthesia/Pain Control\nBlood/Coagulation Disorders\nCancer\nCardiovascular Disorders\nCNS Disorders\nEndocrine/Metabolic Disorders\nGastrointestinal Diseases\nGenitourinary Diseases\nHematologic Diseases\nInfectious Diseases\nInflammation/Immune\nMusculoskeletal Diseases\nNeurodegenerative Diseases\nOphthalmic Diseases\nPain Management\nPsychiatric Disorders\nRare/Orphan Diseases\nRespiratory Diseases\nWound Care']
     column_name = ["service_categories_id"]
@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import openai
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from extract_keywords import ColumnProfiler, extract_unique_words_advanced, is_text_data
+from pre_process_data import pre_process_sample
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+UNORDERABLE_TYPES = {"json", "xml", "point", "polygon", "line", "circle", "box", "path"}
+
+def list_columns(conn, schema: str, table: str) -> list[tuple]:
+    """Returns the (column_name, data_type) pairs of the source table."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s
+            ORDER BY ordinal_position;
+        """, (schema, table))
+        return cursor.fetchall()
+
+def profile_table(conn, schema: str, table: str, columns: list[tuple], sample_limit: int, max_keywords: int,
+                  chunk_size: int = 10000, max_rows: int = None) -> list[tuple]:
+    """
+    Profiles every column in one scan of the table, read through a server-side cursor
+    chunk_size rows at a time. Memory stays bounded by the chunk, the sample reservoirs
+    and the keyword summaries whatever the table size.
+    """
+    selected = [
+        sql.SQL("{}::text").format(sql.Identifier(column_name)) if data_type in UNORDERABLE_TYPES
+        else sql.Identifier(column_name)
+        for column_name, data_type in columns
+    ]
+    query = sql.SQL("SELECT {columns} FROM {table}").format(
+        columns=sql.SQL(", ").join(selected), table=sql.Identifier(schema, table)
+    )
+    if max_rows:
+        query = sql.SQL("{} LIMIT {}").format(query, sql.Literal(max_rows))
+    profilers = [ColumnProfiler(sample_size=sample_limit, max_keywords=max_keywords) for _ in columns]
+
+    with conn.cursor(name="profile_table") as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(query)
+        while rows := cursor.fetchmany(chunk_size):
+            for profiler, values in zip(profilers, zip(*rows)):
+                profiler.update(values)
+    conn.rollback()
+
+    profiles = []
+    for (column_name, data_type), profiler in zip(columns, profilers):
+        sample = [str(item) for item in pre_process_sample(profiler.sample())]
+        keywords = set()
+        if is_text_data([column_name]):
+            keywords.update(extract_unique_words_advanced([column_name]))
+        if profiler.is_text():
+            keywords.update(profiler.keywords(max_keywords))
+        profiles.append((column_name, data_type, sample, sorted(keywords)))
+    return profiles
+
+def profile_column_group(db_url: str, schema: str, table: str, columns: list[tuple], sample_limit: int,
+                         max_keywords: int, chunk_size: int, max_rows: int) -> list[tuple]:
+    """Profiles a group of columns over its own connection. Executed in a worker process."""
+    conn = psycopg2.connect(db_url)
+    try:
+        return profile_table(conn, schema, table, columns, sample_limit, max_keywords, chunk_size, max_rows)
+    finally:
+        conn.close()
+
+def profile_columns(conn, db_url: str, schema: str, table: str, columns: list[tuple], sample_limit: int,
+                    max_keywords: int, chunk_size: int, max_rows: int, workers: int = 1) -> list[tuple]:
+    """
+    Profiles the columns in one scan over conn by default. With more than one worker, the
+    columns are split into one group per worker process, each profiled in its own scan: the
+    table is read once per group, which only pays off when profiling, not reading, is the
+    bottleneck. A single scan is also used when there is no db_url to connect with.
+    """
+    workers = min(workers or 1, len(columns))
+    if workers <= 1 or not db_url:
+        return profile_table(conn, schema, table, columns, sample_limit, max_keywords, chunk_size, max_rows)
+    groups = [columns[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(profile_column_group, db_url, schema, table, group, sample_limit, max_keywords, chunk_size, max_rows)
+            for group in groups
+        ]
+        profiles = {profile[0]: profile for future in futures for profile in future.result()}
+    return [profiles[column_name] for column_name, _ in columns]
+
+def default_description(column_name: str, data_type: str, sample: list[str]) -> str:
+    return f"The column {column_name} of type {data_type} contains values such as " + ", ".join(sample[:10])
+
+def content_hash(sample: list[str], description: str, keywords: list[str]) -> str:
+    payload = json.dumps({"sample": sample, "description": description, "keywords": keywords}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def existing_hashes(conn) -> dict:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT column_name, content_hash FROM public.column_embeddings;")
+        return dict(cursor.fetchall())
+
+def embed_in_batches(client, texts: list[str], batch_size: int) -> list[list[float]]:
+    """Embeds the texts with one API call per batch."""
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts[start:start + batch_size])
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+def write_rows(conn, rows: list[tuple]) -> None:
+    """Upserts the changed columns with execute_values instead of one INSERT per row."""
+    with conn.cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO public.column_embeddings (column_name, description, embedding, keywords, data_type, sample, content_hash, updated_at)
+            VALUES %s
+            ON CONFLICT (column_name) DO UPDATE SET
+                description = EXCLUDED.description,
+                embedding = EXCLUDED.embedding,
+                keywords = EXCLUDED.keywords,
+                data_type = EXCLUDED.data_type,
+                sample = EXCLUDED.sample,
+                content_hash = EXCLUDED.content_hash,
+                updated_at = EXCLUDED.updated_at;
+        """, rows, template="(%s, %s, %s::vector, %s, %s, %s, %s, now())", page_size=500)
+    conn.commit()
+
+def ingest(conn, client, schema: str, table: str, descriptions: dict, sample_limit: int = 200,
+           max_keywords: int = 500, chunk_size: int = 10000, max_rows: int = None,
+           batch_size: int = 512, force: bool = False, db_url: str = None, workers: int = 1) -> dict:
+    """
+    Builds or updates public.column_embeddings from the source table.
+    Columns whose sample, description and keywords hash to the stored content_hash are skipped.
+    """
+    columns = list_columns(conn, schema, table)
+    known_hashes = {} if force else existing_hashes(conn)
+
+    profiles = profile_columns(conn, db_url, schema, table, columns, sample_limit, max_keywords, chunk_size, max_rows, workers)
+
+    changed = []
+    for column_name, data_type, sample, keywords in profiles:
+        description = descriptions.get(column_name) or default_description(column_name, data_type, sample)
+        digest = content_hash(sample, description, keywords)
+        if known_hashes.get(column_name) != digest:
+            changed.append((column_name, description, keywords, data_type, sample, digest))
+
+    if changed:
+        embeddings = embed_in_batches(client, [description for _, description, *_ in changed], batch_size)
+        write_rows(conn, [
+            (column_name, description, str(embedding), keywords, data_type, sample, digest)
+            for (column_name, description, keywords, data_type, sample, digest), embedding in zip(changed, embeddings)
+        ])
+
+    return {"columns": len(profiles), "changed": len(changed), "skipped": len(profiles) - len(changed)}
+
+def main() :
+    parser = argparse.ArgumentParser(description="Builds public.column_embeddings from samples of a source table.")
+    parser.add_argument("table", help="source table as schema.table")
+    parser.add_argument("--descriptions", help="JSON file mapping column names to their descriptions")
+    parser.add_argument("--sample-limit", type=int, default=200, help="distinct values kept in each column's sample")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes profiling groups of columns in parallel, each scanning the table once")
+    parser.add_argument("--max-keywords", type=int, default=500, help="most frequent keywords kept per column")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows fetched from the server-side cursor at a time")
+    parser.add_argument("--max-rows", type=int, default=None, help="stop profiling after this many rows")
+    parser.add_argument("--batch-size", type=int, default=512, help="descriptions embedded per API call")
+    parser.add_argument("--force", action="store_true", help="re-embed every column even if unchanged")
+    args = parser.parse_args()
+
+    load_dotenv()
+    schema, _, table = args.table.rpartition(".")
+    descriptions = {}
+    if args.descriptions:
+        with open(args.descriptions) as f:
+            descriptions = json.load(f)
+
+    client = openai.OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    with psycopg2.connect(os.environ["DB_URL"]) as conn:
+        summary = ingest(conn, client, schema or "public", table, descriptions, args.sample_limit,
+                         args.max_keywords, args.chunk_size, args.max_rows, args.batch_size, args.force,
+                         db_url=os.environ["DB_URL"], workers=args.workers)
+    print(f"{summary['columns']} columns: {summary['changed']} written, {summary['skipped']} unchanged")
+
+if __name__ == "__main__":
+    main()
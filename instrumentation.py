@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("search.timing")
+
+_local = threading.local()
+
+class StageMetrics:
+    """
+    Process-wide latency samples and counters per search stage, shared by all sessions.
+    Only the most recent max_samples durations are kept per stage for the percentiles.
+    """
+    def __init__(self, max_samples: int = 2000):
+        self.max_samples = max_samples
+        self._durations = {}
+        self._totals = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, counts: dict) -> None:
+        with self._lock:
+            self._durations.setdefault(stage, deque(maxlen=self.max_samples)).append(seconds)
+            count, total = self._totals.get(stage, (0, 0.0))
+            self._totals[stage] = (count + 1, total + seconds)
+            stage_counters = self._counters.setdefault(stage, {})
+            for name, value in counts.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    stage_counters[name] = stage_counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        """Returns count, p50, p95 and max latency in seconds for every stage."""
+        with self._lock:
+            durations = {stage: sorted(samples) for stage, samples in self._durations.items()}
+            totals = dict(self._totals)
+            counters = {stage: dict(values) for stage, values in self._counters.items()}
+        return {
+            stage: {
+                "count": totals[stage][0],
+                "p50": _percentile(samples, 0.50),
+                "p95": _percentile(samples, 0.95),
+                "max": samples[-1],
+                "counters": counters.get(stage, {}),
+            }
+            for stage, samples in durations.items()
+        }
+
+    def prometheus_text(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            durations = {stage: sorted(samples) for stage, samples in self._durations.items()}
+            totals = dict(self._totals)
+            counters = {stage: dict(values) for stage, values in self._counters.items()}
+        lines = [
+            "# HELP search_stage_duration_seconds Latency of each search pipeline stage.",
+            "# TYPE search_stage_duration_seconds summary",
+        ]
+        for stage, samples in durations.items():
+            for quantile in (0.5, 0.95, 0.99):
+                lines.append(f'search_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {_percentile(samples, quantile):.6f}')
+            lines.append(f'search_stage_duration_seconds_sum{{stage="{stage}"}} {totals[stage][1]:.6f}')
+            lines.append(f'search_stage_duration_seconds_count{{stage="{stage}"}} {totals[stage][0]}')
+        lines += [
+            "# HELP search_stage_items_total Items counted by each search pipeline stage.",
+            "# TYPE search_stage_items_total counter",
+        ]
+        for stage, values in counters.items():
+            for name, value in values.items():
+                lines.append(f'search_stage_items_total{{stage="{stage}",item="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Atomically writes the Prometheus text dump, e.g. for the node_exporter textfile collector."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+def _percentile(sorted_samples: list[float], quantile: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(quantile * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+metrics = StageMetrics()
+
+def add_counts(**counts) -> None:
+    """Adds counts (cache hits, rows, ...) to the span running on this thread, if any."""
+    span = getattr(_local, "span", None)
+    if span is not None:
+        for name, value in counts.items():
+            span["counts"][name] = span["counts"].get(name, 0) + value
+
+class Trace:
+    """
+    The timing spans of one search. Spans can be opened from any thread; each one is
+    also fed to the process-wide metrics and logged as a structured JSON line.
+    """
+    def __init__(self, query: str = None):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.query = query
+        self.start = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str, **counts):
+        span = {"stage": stage, "counts": dict(counts), "thread": threading.current_thread().name}
+        parent = getattr(_local, "span", None)
+        _local.span = span
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            end = time.perf_counter()
+            _local.span = parent
+            span["start_ms"] = round((start - self.start) * 1000, 2)
+            span["duration_ms"] = round((end - start) * 1000, 2)
+            with self._lock:
+                self.spans.append(span)
+            metrics.observe(stage, end - start, span["counts"])
+            logger.info(json.dumps({"trace_id": self.trace_id, **span}))
+
+    def wrap(self, stage: str, func, counts=None):
+        """Returns func timed as the given stage; counts(result) may return counts to attach."""
+        def wrapped(*args, **kwargs):
+            with self.span(stage) as span:
+                result = func(*args, **kwargs)
+                if counts is not None:
+                    for name, value in counts(result).items():
+                        span["counts"][name] = span["counts"].get(name, 0) + value
+                return result
+        return wrapped
+
+    def wrap_iter(self, stage: str, func, item_name: str = "items"):
+        """Returns a generator function timed from its call until it is exhausted, counting its items."""
+        def wrapped(*args, **kwargs):
+            with self.span(stage) as span:
+                span["counts"][item_name] = 0
+                for item in func(*args, **kwargs):
+                    span["counts"][item_name] += 1
+                    yield item
+        return wrapped
+
+    def as_rows(self) -> list[dict]:
+        """Returns the spans in start order, flattened for display."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return [
+            {"stage": span["stage"], "start_ms": span["start_ms"], "duration_ms": span["duration_ms"],
+             "thread": span["thread"], **span["counts"]}
+            for span in spans
+        ]
+
+def enable_json_logging(path: str = None) -> None:
+    """Emits the span log lines to a file, or to stderr when no path is given. Safe to call more than once."""
+    if any(getattr(handler, "_search_timing", False) for handler in logger.handlers):
+        return
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler._search_timing = True
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
@@ -0,0 +1,62 @@
+import numpy as np
+
+from cached_resource import CachedResource
+
+class KeywordIndex:
+    """
+    An inverted index from keyword to the ids of the columns whose keywords contain it.
+    Match counts for every column are computed in one vectorized pass over the
+    posting lists of the user keywords instead of a per-row unnest query.
+    """
+    def __init__(self, column_names: list[str], keywords: list[list[str]]):
+        self.column_names = list(column_names)
+        self.column_ids = {column_name: column_id for column_id, column_name in enumerate(self.column_names)}
+        self.column_keywords = [list(column_keywords or []) for column_keywords in keywords]
+        postings = {}
+        for column_id, column_keywords in enumerate(self.column_keywords):
+            for keyword in column_keywords:
+                postings.setdefault(keyword, []).append(column_id)
+        self.postings = {keyword: np.asarray(ids, dtype=np.int32) for keyword, ids in postings.items()}
+
+    @classmethod
+    def from_connection(cls, conn) -> "KeywordIndex":
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT column_name, COALESCE(keywords, '{}')
+                FROM public.column_embeddings
+                ORDER BY id;
+            """)
+            rows = cursor.fetchall()
+        return cls([row[0] for row in rows], [row[1] for row in rows])
+
+    def match_counts(self, user_keywords: list[str]) -> np.ndarray:
+        """Returns the number of matching keywords of every column, indexed by column id."""
+        hits = [self.postings[keyword] for keyword in set(user_keywords) if keyword in self.postings]
+        if not hits:
+            return np.zeros(len(self.column_names), dtype=np.int64)
+        return np.bincount(np.concatenate(hits), minlength=len(self.column_names))
+
+    def matched_keywords(self, column_id: int, user_keywords) -> list[str]:
+        """Returns the keywords of a column that appear in the user keywords."""
+        user_keywords = user_keywords if isinstance(user_keywords, (set, frozenset)) else set(user_keywords)
+        return [keyword for keyword in self.column_keywords[column_id] if keyword in user_keywords]
+
+    def search(self, user_keywords: list[str]) -> list[tuple]:
+        """
+        Returns the (column_name, match_count, matched_keywords) rows of the matching
+        columns, ordered by match count. Matched keywords replace the full keyword
+        array so callers no longer need to intersect them again.
+        """
+        counts = self.match_counts(user_keywords)
+        matching = np.flatnonzero(counts)
+        matching = matching[np.argsort(-counts[matching], kind="stable")]
+        user_keywords = set(user_keywords)
+        return [
+            (self.column_names[column_id], int(counts[column_id]), self.matched_keywords(column_id, user_keywords))
+            for column_id in matching.tolist()
+        ]
+
+class CachedKeywordIndex(CachedResource):
+    """Holds one KeywordIndex per process and rebuilds it from the database every refresh_interval seconds."""
+    def __init__(self, refresh_interval: float = 60):
+        super().__init__(KeywordIndex.from_connection, refresh_interval)
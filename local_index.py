@@ -0,0 +1,227 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from embedding_format import EmbeddingFormat
+from keyword_index import KeywordIndex
+
+# The BEFORE UPDATE trigger of helpers/SQL_Queries.SQL bumps updated_at on every update, including
+# ones not made by helpers/ingest_catalog.py, so the fingerprint follows every change without
+# reading the embeddings themselves
+FINGERPRINT_QUERY = """
+    SELECT
+        COUNT(*),
+        md5(COALESCE(string_agg(
+            id::text || ':' || extract(epoch FROM updated_at)::text || ':' || COALESCE(content_hash, ''),
+            ',' ORDER BY id), ''))
+    FROM
+        public.column_embeddings;
+"""
+
+def _normalized(vectors, rows: int) -> np.ndarray:
+    """Returns the vectors as a float32 matrix with unit-length rows, so a dot product is the cosine similarity."""
+    matrix = np.array(vectors, dtype=np.float32).reshape(rows, -1)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return matrix
+
+class _Snapshot:
+    """An immutable, loaded copy of the catalog. Searches hold a reference so a refresh never tears one."""
+    def __init__(self, fingerprint: str, matrix: np.ndarray, column_names: list[str],
+                 descriptions: list[str], keywords: list[list[str]]):
+        self.fingerprint = fingerprint
+        self.matrix = matrix
+        self.column_names = column_names
+        self.descriptions = descriptions
+        self.keywords = keywords
+        self.column_rows = {column_name: row for row, column_name in enumerate(column_names)}
+        self.keyword_index = KeywordIndex(column_names, keywords)
+        self.compact = None
+
+class LocalVectorIndex:
+    """
+    An in-process alternative to searching public.column_embeddings with pgvector.
+    The catalog is written once to a snapshot directory as a normalized float32
+    matrix and memory-mapped, so every worker on the host shares the same pages.
+    All query vectors are answered with one matrix multiply and a top-k per row.
+    With a non-exact embedding_format the multiply runs on a truncated and/or quantized
+    copy of the matrix and only the candidates are rescored against the full vectors.
+    """
+    def __init__(self, snapshot_dir: str = ".cache/column_index", refresh_interval: float = 60,
+                 embedding_format: EmbeddingFormat = None):
+        self.snapshot_dir = snapshot_dir
+        self.refresh_interval = refresh_interval
+        self.embedding_format = embedding_format or EmbeddingFormat()
+        self._snapshot = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def refresh_if_stale(self, connect) -> None:
+        """Reloads the snapshot if the table changed, with connect as for CachedResource.get()."""
+        if self._snapshot is not None and time.monotonic() - self._last_check < self.refresh_interval:
+            return
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._last_check < self.refresh_interval:
+                return
+            with connect() as conn:
+                self.refresh(conn)
+
+    def invalidate(self) -> None:
+        """Makes the next refresh_if_stale() check the table again, whatever the refresh_interval."""
+        with self._lock:
+            self._last_check = float("-inf")
+
+    def refresh(self, conn) -> None:
+        """Loads the snapshot matching the current table contents, building it first if no worker has yet."""
+        with conn.cursor() as cursor:
+            cursor.execute(FINGERPRINT_QUERY)
+            _, fingerprint = cursor.fetchone()
+        self._last_check = time.monotonic()
+        if self._snapshot is not None and self._snapshot.fingerprint == fingerprint:
+            return
+
+        path = os.path.join(self.snapshot_dir, fingerprint)
+        if not os.path.isdir(path):
+            self._write_snapshot(conn, path)
+        self._snapshot = self._load_snapshot(fingerprint, path)
+        self._remove_superseded(fingerprint)
+
+    def _remove_superseded(self, fingerprint: str) -> None:
+        """
+        Deletes the snapshots of older table contents. Workers still searching one keep their
+        memory-mapped pages until they load the new snapshot; half-written snapshots are left alone.
+        """
+        for name in os.listdir(self.snapshot_dir):
+            if name != fingerprint and ".tmp-" not in name:
+                shutil.rmtree(os.path.join(self.snapshot_dir, name), ignore_errors=True)
+
+    def _write_snapshot(self, conn, path: str) -> None:
+        column_names, descriptions, keywords, vectors = [], [], [], []
+        with conn.cursor(name="column_index_snapshot") as cursor:
+            cursor.itersize = 1000
+            cursor.execute("""
+                SELECT column_name, description, COALESCE(keywords, '{}'), embedding::text
+                FROM public.column_embeddings
+                WHERE embedding IS NOT NULL
+                ORDER BY id;
+            """)
+            for column_name, description, column_keywords, embedding in cursor:
+                column_names.append(column_name)
+                descriptions.append(description)
+                keywords.append(list(column_keywords))
+                vectors.append(json.loads(embedding))
+        conn.rollback()
+
+        matrix = _normalized(vectors, len(vectors))
+
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "embeddings.npy"), matrix)
+        with open(os.path.join(tmp_path, "metadata.json"), "w") as f:
+            json.dump({"column_names": column_names, "descriptions": descriptions, "keywords": keywords}, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another worker published the same snapshot first.
+            for name in os.listdir(tmp_path):
+                os.remove(os.path.join(tmp_path, name))
+            os.rmdir(tmp_path)
+
+    def load_rows(self, column_names: list[str], descriptions: list[str], keywords: list[list[str]], embeddings) -> None:
+        """Loads a catalog held in memory instead of a database snapshot, e.g. for benchmarks."""
+        matrix = _normalized(embeddings, len(column_names))
+        snapshot = _Snapshot("in-memory", matrix, list(column_names), list(descriptions), [list(k) for k in keywords])
+        if not self.embedding_format.is_exact:
+            snapshot.compact = self.embedding_format.decode(self.embedding_format.encode(matrix))
+        self._snapshot = snapshot
+        self._last_check = time.monotonic()
+
+    def _load_snapshot(self, fingerprint: str, path: str) -> _Snapshot:
+        matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(path, "metadata.json")) as f:
+            metadata = json.load(f)
+        snapshot = _Snapshot(fingerprint, matrix, metadata["column_names"], metadata["descriptions"], metadata["keywords"])
+        if not self.embedding_format.is_exact:
+            snapshot.compact = self._load_compact(path, matrix)
+        return snapshot
+
+    def _load_compact(self, path: str, matrix: np.ndarray) -> np.ndarray:
+        """
+        Loads the compact matrix of the snapshot, encoding and saving it next to the full one on
+        first use, and decodes it to float32 once so queries do not pay for the conversion.
+        """
+        compact_path = os.path.join(path, f"embeddings-{self.embedding_format.name}.npy")
+        if not os.path.exists(compact_path):
+            tmp_path = f"{compact_path}.tmp-{os.getpid()}-{threading.get_ident()}.npy"
+            np.save(tmp_path, self.embedding_format.encode(matrix))
+            os.replace(tmp_path, compact_path)
+        return self.embedding_format.decode(np.load(compact_path))
+
+    def _top_k(self, snapshot: _Snapshot, embeddings: list[list[float]], mask, limit: int):
+        """Returns the (row, distance) pairs of the closest allowed columns for every query vector."""
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if snapshot.compact is not None:
+            return self._rescored_top_k(snapshot, queries, mask, limit)
+        distances = 1.0 - queries @ snapshot.matrix.T
+        if mask is not None:
+            distances[:, ~mask] = np.inf
+
+        k = min(limit, int(mask.sum()) if mask is not None else distances.shape[1])
+        if k <= 0:
+            return [[] for _ in embeddings]
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1, kind="stable")
+        rows = np.take_along_axis(candidates, order, axis=1)
+        return [
+            list(zip(row.tolist(), np.take_along_axis(distances[i], row, axis=0).tolist()))
+            for i, row in enumerate(rows)
+        ]
+
+    def _rescored_top_k(self, snapshot: _Snapshot, queries: np.ndarray, mask, limit: int):
+        """Picks candidates with the compact matrix, then ranks them by their exact distance to the full vectors."""
+        distances = self.embedding_format.approximate_distances(queries, snapshot.compact)
+        if mask is not None:
+            distances[:, ~mask] = np.inf
+
+        k = min(max(limit, self.embedding_format.candidates), int(mask.sum()) if mask is not None else distances.shape[1])
+        if k <= 0:
+            return [[] for _ in queries]
+        candidates = np.sort(np.argpartition(distances, k - 1, axis=1)[:, :k], axis=1)
+        ranked = []
+        for query, rows in zip(queries, candidates):
+            # Sorted rows read the memory-mapped full matrix in file order
+            exact = 1.0 - snapshot.matrix[rows] @ query
+            order = np.argsort(exact, kind="stable")[:limit]
+            ranked.append(list(zip(rows[order].tolist(), exact[order].tolist())))
+        return ranked
+
+    def describe(self, column_names: list[str]) -> dict:
+        """Returns the descriptions of the given columns found in the snapshot."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {}
+        return {name: snapshot.descriptions[snapshot.column_rows[name]] for name in column_names if name in snapshot.column_rows}
+
+    def hybrid_search(self, embeddings: list[list[float]], user_keywords: list[str], limit: int = 25) -> list[list[tuple]]:
+        """Returns the same rows as the SQL hybrid_search, computed from the local snapshot."""
+        snapshot = self._snapshot
+        if not embeddings or snapshot is None or not snapshot.column_names:
+            return [[] for _ in embeddings]
+        counts = snapshot.keyword_index.match_counts(user_keywords)
+        mask = counts > 0
+        if not mask.any():
+            mask = None
+        user_keywords = set(user_keywords)
+        return [
+            [
+                (snapshot.column_names[row], snapshot.descriptions[row], rank, distance, int(counts[row]),
+                 snapshot.keyword_index.matched_keywords(row, user_keywords))
+                for rank, (row, distance) in enumerate(ranked, 1)
+            ]
+            for ranked in self._top_k(snapshot, embeddings, mask, limit)
+        ]
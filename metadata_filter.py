@@ -1,19 +1,108 @@
 import re
+import json
+import os
+import threading
+from functools import lru_cache
 from dotenv import load_dotenv
-import inflect
 from urllib.parse import urlparse
-from nltk.corpus import wordnet
 
-def extract_unique_words_advanced(data_list):
+DELIMITERS = re.compile(r'[\x20-\x2F\x39-\x40\x5B-\x60\x7B-\x7E]+')
+PUNCTUATION = re.compile(r'[^\w\s]+')
+
+_lexicon = {}
+_wordnet = None
+_wordnet_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def get_inflect_engine():
+    """Returns the process-wide inflect engine instead of building one per query."""
+    import inflect
+    return inflect.engine()
+
+def get_wordnet():
     """
-    Processes user query to generate a list of keywords to search the database for.
+    Imports and loads the WordNet corpus reader on first use, keeping NLTK off the import path.
+    NLTK's lazy loader replaces itself with the reader without any locking, so it is loaded
+    once here under a lock and callers only ever see the loaded reader.
     """
-    p = inflect.engine()
-    unique_words_set = set()
-    delimiters = r'[\x20-\x2F\x39-\x40\x5B-\x60\x7B-\x7E]+'
+    global _wordnet
+    if _wordnet is None:
+        with _wordnet_lock:
+            if _wordnet is None:
+                from nltk.corpus import wordnet
+                wordnet.ensure_loaded()
+                _wordnet = wordnet
+    return _wordnet
+
+def load_lexicon(path: str) -> int:
+    """
+    Loads a precomputed lexicon mapping domain keywords to their inflections and synonyms.
+    Returns the number of entries, or 0 if the file does not exist.
+    """
+    global _lexicon
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        _lexicon = {token: frozenset(expansions) for token, expansions in json.load(f).items()}
+    expand_token.cache_clear()
+    return len(_lexicon)
+
+def build_lexicon(vocabulary, path: str) -> int:
+    """Expands every word of the vocabulary and writes the result as a lexicon file."""
+    lexicon = {}
+    for word in sorted(set(vocabulary)):
+        if word:
+            lexicon[word] = sorted(expand_token(word))
+    with open(path, "w") as f:
+        json.dump(lexicon, f)
+    return len(lexicon)
+
+@lru_cache(maxsize=100000)
+def expand_token(token: str) -> frozenset:
+    """
+    Returns the token with its plural and singular forms and the WordNet synonyms of all of them.
+    """
+    if token in _lexicon:
+        return _lexicon[token]
+    p = get_inflect_engine()
+    words = {token}
+    plural = p.plural(token)
+    singular = p.singular_noun(token)
+    if plural:
+        words.add(plural)
+    if singular:
+        words.add(singular)
+
+    wordnet = get_wordnet()
+    for word in list(words):
+        for syn in wordnet.synsets(word):
+            for lemma in syn.lemmas():
+                words.add(lemma.name().replace('_', ' '))
+    return frozenset(words)
+
+def warm_up(lexicon_path: str = None) -> None:
+    """Loads the lexicon, the inflect engine and the WordNet corpus so the first query does not pay for them."""
+    load_lexicon(lexicon_path)
+    get_inflect_engine()
+    get_wordnet()
+    expand_token("company")
+
+def normalize_query(user_input: str, use_keywords: bool = False) -> str:
+    """
+    Reduces a user query to a canonical form for cache keys: lower case, without
+    punctuation and with single spaces. With use_keywords the sorted, expanded
+    keyword set is used instead, so word order and inflections no longer matter.
+    """
+    if use_keywords:
+        return " ".join(sorted(extract_unique_words_advanced([user_input])))
+    return " ".join(PUNCTUATION.sub(" ", user_input.lower()).split())
+
+def extract_query_tokens(data_list) -> set:
+    """Splits the user query into its lower case tokens, before any expansion."""
+    tokens_set = set()
 
     for item in data_list:
-        tokens = re.split(delimiters, str(item))
+        tokens = DELIMITERS.split(str(item))
         for token in tokens:
             token_lower = token.lower()
             if token_lower.startswith('http'):
@@ -26,27 +115,41 @@ def extract_unique_words_advanced(data_list):
                     else:
                         domain_name = domain_parts[0]
                     if domain_name:
-                        unique_words_set.add(domain_name)
+                        tokens_set.add(domain_name)
                 except Exception:
                     continue
             else:
-                clean_word = token_lower.strip('.,!?:;') 
+                clean_word = token_lower.strip('.,!?:;')
                 if clean_word:
-                    unique_words_set.add(clean_word)
+                    tokens_set.add(clean_word)
+    return tokens_set
+
+def extract_unique_words_advanced(data_list):
+    """
+    Processes user query to generate a list of keywords to search the database for.
+    """
+    unique_words_set = set()
+    for token in extract_query_tokens(data_list):
+        unique_words_set |= expand_token(token)
 
-        for word in list(unique_words_set) :
-            plural = p.plural(word)
-            singular = p.singular_noun(word)
-            if plural :
-                unique_words_set.add(plural)
-            if singular:
-                unique_words_set.add(singular)
+    return list(unique_words_set)
 
-        for word in list(unique_words_set) :
-            for syn in wordnet.synsets(word) :
-                for lemma in syn.lemmas():
-                    synonym = lemma.name().replace('_', ' ')
-                    unique_words_set.add(synonym) 
+def main() :
+    """Builds the keyword lexicon from the vocabulary stored in public.column_embeddings.keywords."""
+    import argparse
+    import psycopg2
 
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("output", nargs="?", default="keyword_lexicon.json")
+    args = parser.parse_args()
 
-    return list(unique_words_set)
+    load_dotenv()
+    with psycopg2.connect(os.environ["DB_URL"]) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT unnest(keywords) FROM public.column_embeddings;")
+            vocabulary = [row[0] for row in cursor.fetchall()]
+
+    print(f"Wrote {build_lexicon(vocabulary, args.output)} lexicon entries to {args.output}")
+
+if __name__ == "__main__":
+    main()
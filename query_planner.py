@@ -0,0 +1,89 @@
+from metadata_filter import PUNCTUATION, expand_token, extract_query_tokens
+
+TIER_NAMES = {1: "keywords", 2: "raw_query", 3: "reformulation"}
+# Words that say nothing about which column is meant; they never count towards tier 1 confidence
+STOPWORDS = frozenset("""
+    a about all an and any are as at be been by can could did do does for from get give had has have how i if in
+    into is it its list me my of on or show that the their them there these they this those to was were what when
+    where which who whom whose why will with would you your
+""".split())
+
+class QueryPlanner:
+    """
+    Decides how much work a query needs before the LLM is involved.
+    Tier 1 answers from an exact column name or the keyword index alone, tier 2
+    from the embedding of the raw query and tier 3 runs the full reformulation.
+    A tier only answers when its confidence thresholds are met, otherwise the
+    query escalates to the next one.
+    """
+    def __init__(self, min_keyword_matches: int = 2, max_keyword_candidates: int = 2,
+                 max_distance: float = 0.45, min_distance_margin: float = 0.05):
+        self.min_keyword_matches = min_keyword_matches
+        self.max_keyword_candidates = max_keyword_candidates
+        self.max_distance = max_distance
+        self.min_distance_margin = min_distance_margin
+
+    @classmethod
+    def from_settings(cls, settings) -> "QueryPlanner":
+        return cls(
+            min_keyword_matches=int(settings.get("PLANNER_MIN_KEYWORD_MATCHES", 2)),
+            max_keyword_candidates=int(settings.get("PLANNER_MAX_KEYWORD_CANDIDATES", 2)),
+            max_distance=float(settings.get("PLANNER_MAX_DISTANCE", 0.45)),
+            min_distance_margin=float(settings.get("PLANNER_MIN_DISTANCE_MARGIN", 0.05)),
+        )
+
+    def exact_column(self, user_input: str, column_names) -> str:
+        """Returns the column the query names exactly ("city", "animals housed"), if any. column_names may be any container."""
+        normalized = "_".join(PUNCTUATION.sub(" ", user_input.lower()).split())
+        return normalized if normalized in column_names else None
+
+    def token_matches(self, user_input: str, keyword_matches: list[tuple]) -> list[tuple]:
+        """
+        Recounts the (column_name, match_count, matched_keywords) rows of the keyword index by
+        the distinct query words they match: every matched expansion is mapped back to the
+        words it came from, so "drug" and "drugs" count once, and stopwords do not count.
+        Returns the rows matching at least one word, best first.
+        """
+        expansions = {
+            token: expand_token(token) for token in extract_query_tokens([user_input]) if token not in STOPWORDS
+        }
+        rows = []
+        for column_name, _, matched_keywords in keyword_matches:
+            matched = set(matched_keywords)
+            count = sum(1 for words in expansions.values() if not words.isdisjoint(matched))
+            if count:
+                rows.append((column_name, count, matched_keywords))
+        return sorted(rows, key=lambda row: -row[1])
+
+    def keyword_tier(self, user_input: str, keyword_matches: list[tuple], column_names) -> list[tuple]:
+        """
+        Returns the (column_name, match_count, matched_keywords) rows answering the query in tier 1,
+        or None to escalate. match_count is the number of distinct query words matched, see
+        token_matches. The keyword index answers when at most max_keyword_candidates columns
+        share the best count and that count reaches min_keyword_matches.
+        An exact column name answers on its own and is ranked first.
+        """
+        exact = self.exact_column(user_input, column_names)
+        if exact is not None:
+            rest = [row for row in keyword_matches if row[0] != exact]
+            exact_row = next((row for row in keyword_matches if row[0] == exact), (exact, 0, []))
+            return [exact_row] + rest
+        keyword_matches = self.token_matches(user_input, keyword_matches)
+        if not keyword_matches:
+            return None
+        best = keyword_matches[0][1]
+        tied = sum(1 for _, match_count, _ in keyword_matches if match_count == best)
+        if best >= self.min_keyword_matches and tied <= self.max_keyword_candidates:
+            return keyword_matches
+        return None
+
+    def vector_confident(self, ranked: list[tuple]) -> bool:
+        """
+        Whether the ranked (column_name, description, rank, distance, ...) rows of the raw query
+        answer it in tier 2: the nearest column is close enough and clearly ahead of the runner-up.
+        """
+        if not ranked:
+            return False
+        nearest = ranked[0][3]
+        runner_up = ranked[1][3] if len(ranked) > 1 else float("inf")
+        return nearest <= self.max_distance and runner_up - nearest >= self.min_distance_margin
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+
+# The id digest changes whenever a column is added or removed, even if the count does not
+CATALOG_VERSION_QUERY = """
+    SELECT COUNT(*), md5(COALESCE(string_agg(id::text, ',' ORDER BY id), '')), MAX(updated_at)
+    FROM public.column_embeddings;
+"""
+CHANGED_COLUMNS_QUERY = """
+    SELECT column_name, COALESCE(keywords, '{}')
+    FROM public.column_embeddings
+    WHERE updated_at > %s;
+"""
+
+class ResultCache:
+    """
+    The final results of recent searches, held in process memory so a repeated query
+    skips every stage. Entries are keyed by the normalized query and checked against
+    the catalog version, the set of column ids and MAX(updated_at) of
+    public.column_embeddings, at most every check_interval seconds.
+
+    When re-ingested columns move the version, only the entries those columns can
+    affect are dropped: entries listing one of them in their results, and entries
+    whose query keywords match one of their keywords. Added or removed columns may
+    rank for any query, so a changed id set drops every entry. A column whose
+    new embedding ranks it for a query it shares no keyword with is only picked up
+    once the entry expires after ttl seconds.
+
+    Every version change starts a new generation. A result computed during an older
+    generation may come from indexes built before the change, so set() discards it.
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = None, check_interval: float = 5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._by_column = {}
+        self._by_keyword = {}
+        self._version = None
+        self._generation = 0
+        self._checked_at = 0.0
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "invalidated": 0, "evicted": 0, "flushes": 0, "discarded": 0}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def refresh_if_stale(self, connect, on_change=None) -> None:
+        """
+        Checks the catalog version if it was not checked recently, with connect as for
+        CachedResource.get(). on_change() is called when the version moved, before the new
+        generation starts, e.g. to mark the indexes the results are built from stale.
+        """
+        if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._refresh_lock:
+            if self._version is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            with connect() as conn:
+                self.refresh(conn, on_change)
+
+    def refresh(self, conn, on_change=None) -> None:
+        """Reads the catalog version and drops the entries the changes since the last check affect."""
+        with conn.cursor() as cursor:
+            cursor.execute(CATALOG_VERSION_QUERY)
+            version = cursor.fetchone()
+            previous = self._version
+            changed = {}
+            if previous is not None and version != previous and version[:2] == previous[:2] and previous[2] is not None:
+                cursor.execute(CHANGED_COLUMNS_QUERY, (previous[2],))
+                changed = {column_name: list(keywords) for column_name, keywords in cursor.fetchall()}
+        conn.rollback()
+
+        if previous is not None and version != previous:
+            if on_change is not None:
+                on_change()
+            with self._lock:
+                self._generation += 1
+                if changed:
+                    self._invalidate_columns(changed)
+                else:
+                    self._clear()
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    def get(self, key: str):
+        """Returns the stored result, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[3] >= self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[0]
+
+    def set(self, key: str, value, column_names: list[str], keywords: list[str], generation: int = None) -> None:
+        """
+        Stores a result with the columns it lists and the keywords it was searched with, evicting
+        the least recently used entries above max_entries. generation is the one the search
+        started in; results of an older generation are discarded.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._counters["discarded"] += 1
+                return
+            self._remove(key)
+            column_names, keywords = frozenset(column_names), frozenset(keywords)
+            self._entries[key] = (value, column_names, keywords, time.monotonic())
+            for column_name in column_names:
+                self._by_column.setdefault(column_name, set()).add(key)
+            for keyword in keywords:
+                self._by_keyword.setdefault(keyword, set()).add(key)
+            self._counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._counters["evicted"] += 1
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        _, column_names, keywords, _ = entry
+        for index, names in ((self._by_column, column_names), (self._by_keyword, keywords)):
+            for name in names:
+                keys = index.get(name)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[name]
+        return True
+
+    def invalidate_columns(self, columns: dict) -> int:
+        """Drops the entries listing one of the columns or matching one of their keywords. columns maps names to keyword lists."""
+        with self._lock:
+            return self._invalidate_columns(columns)
+
+    def _invalidate_columns(self, columns: dict) -> int:
+        keys = set()
+        for column_name, keywords in columns.items():
+            keys.update(self._by_column.get(column_name, ()))
+            for keyword in keywords:
+                keys.update(self._by_keyword.get(keyword, ()))
+        removed = sum(self._remove(key) for key in keys)
+        self._counters["invalidated"] += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._counters["invalidated"] += len(self._entries)
+        self._counters["flushes"] += 1
+        self._entries.clear()
+        self._by_column.clear()
+        self._by_keyword.clear()
+
+    def stats(self) -> dict:
+        """Returns the entry count, the hit rate and the counters since the process started."""
+        with self._lock:
+            counters = dict(self._counters)
+            entries = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        version = None if self._version is None else {"columns": self._version[0], "updated_at": str(self._version[2])}
+        return {"entries": entries, "generation": self._generation, "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+                **counters, "catalog_version": version}
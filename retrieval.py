@@ -0,0 +1,431 @@
+import hashlib
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from disk_cache import DiskCache
+from embedding_format import EmbeddingFormat, vector_literal
+from instrumentation import add_counts
+from keyword_index import KeywordIndex
+from metadata_filter import normalize_query
+from schema_context import SchemaContext, count_tokens
+
+DOMAIN_NAME = "Pharmaceutical"
+TABLE_DESCRIPTION = "This table contains information about companies and their service categories, including company details, service classifications, geographic location, and various analytical and manufacturing equipment."
+ALL_COLUMNS = [
+    "address - TextField - '26 Corporate Circle",
+    "animals_housed - CharField - 'Transgenic Mouse'",
+    "business_model - TextField - 'pharma/bio",
+    "business_sector - CharField - 'Academics\\nAgrochemicals\\nBiopharmaceutical\\nBiosimilar/Biobetter\\nChemicals\\nCosmetics/Personal Care\\nGenerics\\nGovernment\\nNutraceuticals\\nVeterinary'",
+    "city - CharField - 'Albany'",
+    "company_id - IntegerField - 1766",
+    "company_link - TextField - ",
+    "company_name - CharField - 'Curia Inc.'",
+    "company_name_hash - CharField - '9d53d1e503b0a4c9d28e47e513b3bc3d'",
+    "company_profile_link - TextField - ",
+    "company_summary - TextField - 'Curia Inc. is a contract research and manufacturing organization (CRMO) that provides a range of services to the pharmaceutical and biotechnology industries. It offers integrated solutions for drug discovery",
+    "company_website - TextField - 'https://curiaglobal.com/'",
+    "development_stage - CharField - 'Clinical\\nDiscovery\\nPhase 1\\nPhase 2\\nPhase 3\\nPreclinical'",
+    "entity_hierarchy - CharField - 'Research Supplies|Life Sciences Supplies/Reagents|Imaging/Labeling Reagents|Labeling Reagents/Kits'",
+    "entity_s - TextField - 'consultant\\nareas of expertise\\nbusiness development (corporate)\\ncorporate functions\\nstrategic consulting'",
+    "facility_inspection - CharField - 'Biosafety level\\nBrazil (ANVISA)\\nBSL2\\nCertifications/Accreditations/Licenses\\nClean Rooms\\nCountry Regulatory/Accreditation\\nDEA\\nFacility Licenses\\nGLP Certification\\nGMP Certification\\nGMP-UK\\nGMP-USA\\nInspected\\nISO 13485:2016\\nISO 17025\\nISO 7 Clean Room (Class 10000)\\nISO 9001:2008\\nISO 9001:2015\\nISTA\\nItaly (AIFA/NSIS)\\nJapan (PMDA/MHLW)\\nLicensed/Registered\\nSouth Korea (KFDA/MFDS)\\nUnited Kingdom (MHRA)\\nUSA (FDA/ACVM)'",
+    "latitude - CharField - '42.7032423'",
+    "level_2 - CharField - 'Packaging Equipment'",
+    "level_3 - CharField - 'Patient Access Solution'",
+    "level_4 - CharField - 'Intrinsic Factor'",
+    "level_5 - CharField - 'Protein-Protein Docking'",
+    "level_6 - CharField - 'Polysaccharides'",
+    "longitude - CharField - '-73.8745414'",
+    "molecule_type - CharField - 'Antibody\\nBiological Molecules\\nCell Based\\nGene/DNA\\nmRNA\\nNucleic Acid Molecules\\nOligonucleotides\\nPeptide\\nProtein\\nSmall Molecules\\nViral Vectors'",
+    "moment - DateTimeField - '2025-07-06T14:08:16'",
+    "number_of_employees - FloatField - ",
+    "parent_service - CharField - 'Supply Chain'",
+    "private_public - CharField - 'public'",
+    "process_equipment - TextField - '1D NMR Analysis\\n2D NMR Analysis\\nAgilent 8453 UV-Visible Spectrophotometers\\nAKTA Explorer\\nAnalytical Equipment\\nAPI Equipment\\nAPI Process Equipment\\nBioanalytical/Genomics Equipment\\nBiorad QX200\\nBioreactors API\\nC13 NMR\\nCalorimeter\\nCapillary Electrophoresis  (CE)\\nCapsule Filling/Equipment\\nCE-SDS\\nChiral Chromatography\\nChromatography Equipment\\ncIEF\\nClinical Chemistry/Immunoassay Analyzer Equipments\\nddPCR\\nDifferential Scanning Calorimetry (DSC)\\nDifferential Scanning Fluorimetry (DSF)\\nDot Blot Equipment\\nDry Granulation (Roller Compactor/Chilsonator)\\nDrying Process/Equipment\\nElectrophoresis\\nELISA Equipment\\nEnergy Dispersive X-Ray (EDX) Spectroscopy\\nF19 NMR\\nFluid Bed Coating\\nFluid Bed Dryer/Coater/Granulator\\nFluid Bed Drying\\nFormulation drying platforms\\nFPLC systems\\nFreeze Drying/Lyophilization Equipment\\nFTIR (FT-IR)\\nGenomics/Sequencing Equipment\\nGlass-Lined Reactors\\nGlass-Lined Reactors (=< 8000 L)\\nGranulation/Agglomeration Process\\nH1",
+    "product_group - CharField - 'Antibiotic Products\\nAntibody Drug Conjugates (ADCs)\\nBioconjugates\\nBiologicals/Advanced Therapies\\nBiopharmaceutical Products\\nControlled Substances\\nCytotoxics\\nDrug Conjugates\\nHighly Potent Compounds\\nHormonal Products\\nNatural Products\\nSchedule I Drugs\\nSchedule II Drugs\\nSchedule III Drugs\\nSchedule IV Drugs\\nSchedule V Drugs\\nSterile API\\nSteroids\\nVaccine/Adjuvant'",
+    "route - CharField - 'Inhalation\\nInjection\\nOphthalmic\\nOral\\nTopical'",
+    "service_categories_id - AutoField - 13282",
+    "service_category_id - IntegerField - 5749",
+    "service_category_name - CharField - 'Staining Reagents'",
+    "service_type - CharField - 'development stage'",
+    "state - CharField - 'MA-Massachusetts'",
+    "sub_service - CharField - 'Hydrochloric Acid'",
+    "territory_name - CharField - 'China'",
+    "therapeutic_category - CharField - 'Rare/Orphan Diseases'",
+    "top_service - CharField - 'Clinical Trials'",
+    "year_founded - IntegerField - 1991"
+]
+
+REFORMULATION_MODEL = "gpt-4.1-mini"
+DESCRIPTION_MARKER = "The column"
+
+REFORMULATION_INSTRUCTIONS = """
+    Generate short, highly technical, domain-specific descriptions of the columns of a database table that most likely contain the information requested by the user using :
+    1. user_input : A natural language user query
+    2. table_description : A database table description.
+    3. domain_name : The domain name of the database.
+    4. all_columns : The names of all the columns in the table, their data types and sample items, one column per line as "name (data type): sample; sample"
+
+    Methodology :
+    1. {{common keywords and special terminology}} : Use common keywords and special terminology from the given domain based on your prior information of the domains keywords, the table description and the user input.
+    2. {{data type}} and {{structure}} : Infer the data type from all_columns and infer the structure of data requested mentioning it explicitly and using it to guide the description to explain what it implies (e.g., integer/double columns as measurements, longtext/varchar columns as descriptive text/categorical labels/short text identifiers, datetime columns as temporal markers for timestamps/event times).
+    3. {{represents}}  : Describe what the column data means and repesents in enough detail to uniquely identify what the column represents in context of the domain and table.
+    4. {{column name}} : Analyse the column_names, their data types and sample item to identify the column name of the column most likely to contain the information requested by the user.
+    5. {{relationship}} : Additionally analyse all the column names, their data types and sample item to determine other columns related to the current column and describe their relationship
+    6. Combine 1-5 to generate a technical description of the next most relevant column as a single, detailed paragraph
+    7. Repeat 6 for more columns potentially containing the information requested by the user in the order of most likely to least likely
+
+    Output rules for a single description :
+    1. Generate only a single clean paragraph of text and nothing else
+    2. Do not format the paragraph
+    3. Do not include JSON in the paragraph
+
+    Output format for a single description :
+    The column {{column name}} of type {{data type}} in {{structure}} describes {{represents}}, encompassing {{common keywords and special terminology}} and {{relationship}}
+
+    Full output format :
+    Description 1
+    {{newline}}
+    Description 2
+    {{newline}}
+    ...
+    Description n
+
+    Context :
+    table_description : {table_description}
+    domain_name : {domain_name}"""
+
+REFORMULATION_CONTEXT_TEMPLATE = """all_columns :
+{all_columns}
+
+user_input : {user_input}"""
+
+# OpenAI only caches prompt prefixes of at least this many tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+@lru_cache(maxsize=1)
+def static_instructions() -> str:
+    """
+    The system prompt, identical for every query and sent first. It is shorter than
+    PROMPT_CACHE_MIN_TOKENS, so the provider only caches the prompt when the column context
+    that follows is long enough and unpruned; python schema_context.py reports the prefix length.
+    """
+    return REFORMULATION_INSTRUCTIONS.format(table_description=TABLE_DESCRIPTION, domain_name=DOMAIN_NAME)
+
+@lru_cache(maxsize=1)
+def default_schema_context() -> SchemaContext:
+    return SchemaContext.from_registry(ALL_COLUMNS)
+
+def full_schema_text() -> str:
+    """The verbose column list the prompt used to carry, kept for token count comparisons."""
+    return "\n".join([f'"{item}"' for item in ALL_COLUMNS])
+
+def build_reformulation_messages(user_input: str, schema_text: str = None) -> list[dict]:
+    """
+    Builds the chat messages: the static instructions first, then the column context
+    and the user query, which are the only parts that change between queries.
+    """
+    if schema_text is None:
+        schema_text = default_schema_context().render()
+    return [
+        {"role": "system", "content": static_instructions()},
+        {"role": "user", "content": REFORMULATION_CONTEXT_TEMPLATE.format(all_columns=schema_text, user_input=user_input)},
+    ]
+
+def reformulation_cache_key(user_input: str, use_keywords: bool = False, schema_text: str = None) -> str:
+    """
+    Keys a query by its normalized form together with the model, the prompt
+    and the column context, so changing any of them invalidates the cached entries.
+    """
+    normalized = normalize_query(user_input, use_keywords=use_keywords)
+    if schema_text is None:
+        schema_text = default_schema_context().render()
+    payload = json.dumps([REFORMULATION_MODEL, static_instructions(), REFORMULATION_CONTEXT_TEMPLATE, schema_text, normalized])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _record_prompt_tokens(messages: list[dict]) -> None:
+    add_counts(prompt_tokens=sum(count_tokens(message["content"]) for message in messages))
+
+def reformulate_for_query(user_input: str, client, cache: DiskCache = None, use_keywords: bool = False,
+                          schema_text: str = None) -> list[str]:
+    """
+    Generates technical descriptions from a user query using the OpenAI API.
+    schema_text is the column context, by default every column of ALL_COLUMNS in compact form.
+    Results are read from and written to the cache when one is given.
+    """
+    key = reformulation_cache_key(user_input, use_keywords, schema_text)
+    cached = cache.get(key) if cache is not None else None
+    add_counts(cache_hits=int(cached is not None), cache_misses=int(cached is None))
+    if cached is not None:
+        return json.loads(cached)
+
+    messages = build_reformulation_messages(user_input, schema_text)
+    _record_prompt_tokens(messages)
+    response = client.chat.completions.create(
+        model=REFORMULATION_MODEL,
+        messages=messages,
+        temperature=0
+    )
+
+    descriptions_text = response.choices[0].message.content.strip()
+    descriptions = [(DESCRIPTION_MARKER + " " + desc.strip()) for desc in descriptions_text.split(DESCRIPTION_MARKER) if desc.strip()]
+    if cache is not None:
+        cache.set(key, json.dumps(descriptions))
+    return descriptions
+
+def iter_descriptions(text_chunks):
+    """
+    Splits a stream of completion text into descriptions, yielding each one as soon
+    as the next description marker shows that it is complete.
+    """
+    buffer = ""
+    for chunk in text_chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(DESCRIPTION_MARKER)
+        for desc in complete:
+            if desc.strip():
+                yield DESCRIPTION_MARKER + " " + desc.strip()
+    if buffer.strip():
+        yield DESCRIPTION_MARKER + " " + buffer.strip()
+
+def stream_reformulation(user_input: str, client, cache: DiskCache = None, use_keywords: bool = False,
+                         schema_text: str = None):
+    """Generates the same descriptions as reformulate_for_query while the completion is still streaming."""
+    key = reformulation_cache_key(user_input, use_keywords, schema_text)
+    cached = cache.get(key) if cache is not None else None
+    add_counts(cache_hits=int(cached is not None), cache_misses=int(cached is None))
+    if cached is not None:
+        yield from json.loads(cached)
+        return
+
+    messages = build_reformulation_messages(user_input, schema_text)
+    _record_prompt_tokens(messages)
+    response = client.chat.completions.create(
+        model=REFORMULATION_MODEL,
+        messages=messages,
+        temperature=0,
+        stream=True
+    )
+    text_chunks = (chunk.choices[0].delta.content or "" for chunk in response if chunk.choices)
+    descriptions = []
+    for description in iter_descriptions(text_chunks):
+        descriptions.append(description)
+        yield description
+    if descriptions and cache is not None:
+        cache.set(key, json.dumps(descriptions))
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+
+def embedding_cache_key(text: str, model: str = EMBEDDING_MODEL) -> str:
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+def get_embeddings(texts: list[str], client, store: DiskCache = None) -> list[list[float]]:
+    """
+    Generates vector embeddings for a list of text strings.
+    Embeddings already in the store are reused and all the missing ones
+    are requested from the OpenAI API in a single batched call.
+    """
+    if not texts:
+        return []
+    keys = [embedding_cache_key(text) for text in texts]
+    cached = store.get_many(keys) if store is not None else {}
+
+    missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in cached))
+    add_counts(texts=len(texts), cache_hits=len(texts) - len(missing), cache_misses=len(missing))
+    if missing:
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=missing)
+        new_entries = {
+            embedding_cache_key(text): np.asarray(item.embedding, dtype=np.float32).tobytes()
+            for text, item in zip(missing, sorted(response.data, key=lambda item: item.index))
+        }
+        if store is not None:
+            store.set_many(new_entries)
+        cached.update(new_entries)
+
+    return [np.frombuffer(cached[key], dtype=np.float32).tolist() for key in keys]
+
+def get_column_descriptions(column_names: list[str], conn) -> dict:
+    """Returns a dictionary mapping the given column names to their descriptions."""
+    if not column_names:
+        return {}
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name, description
+            FROM public.column_embeddings
+            WHERE column_name = ANY(%s);
+        """, (list(column_names),))
+        return dict(cursor.fetchall())
+
+KEYWORD_MATCH_QUERIES = {
+    # Intersects the keyword array of every row passing the GIN prefilter
+    "array": """
+        SELECT
+            id,
+            ARRAY(SELECT k
+                  FROM unnest(keywords) as k
+                  WHERE k = ANY(%(keywords)s::text[])) as matched_keywords
+        FROM
+            public.column_embeddings
+        WHERE
+            keywords && %(keywords)s::text[]
+    """,
+    # Looks the keywords up in the normalized public.column_keywords table
+    "table": """
+        SELECT
+            column_id as id,
+            array_agg(keyword) as matched_keywords
+        FROM
+            public.column_keywords
+        WHERE
+            keyword = ANY(%(keywords)s::text[])
+        GROUP BY
+            column_id
+    """,
+    # The columns were already matched by the in-process KeywordIndex
+    "memory": """
+        SELECT
+            id,
+            '{}'::text[] as matched_keywords
+        FROM
+            public.column_embeddings
+        WHERE
+            column_name = ANY(%(columns)s::text[])
+    """,
+}
+
+HYBRID_SEARCH_QUERY = """
+    WITH keyword_matches AS MATERIALIZED ({keyword_matches}),
+    query_vectors AS (
+        SELECT query_index - 1 as query_index, vector_text::vector as embedding
+        FROM unnest(%(vectors)s::text[]) WITH ORDINALITY as q(vector_text, query_index)
+    )
+    SELECT
+        qv.query_index,
+        r.column_name,
+        r.description,
+        r.rank,
+        r.distance,
+        cardinality(r.matched_keywords) as match_count,
+        r.matched_keywords
+    FROM
+        query_vectors qv
+    CROSS JOIN LATERAL (
+        SELECT
+            ce.column_name,
+            ce.description,
+            ce.embedding <=> qv.embedding as distance,
+            COALESCE(km.matched_keywords, '{{}}') as matched_keywords,
+            row_number() OVER (ORDER BY ce.embedding <=> qv.embedding) as rank
+        FROM
+            public.column_embeddings ce
+        LEFT JOIN keyword_matches km ON km.id = ce.id
+        -- Only the prefiltered columns are searched when any keyword matched
+        WHERE
+            km.id IS NOT NULL OR NOT EXISTS (SELECT 1 FROM keyword_matches)
+        ORDER BY
+            distance
+        LIMIT %(limit)s
+    ) r
+    ORDER BY
+        qv.query_index, r.rank;
+"""
+
+# Candidates come from a truncated (and halfvec) expression over the stored vectors, which an
+# expression HNSW index can serve, and are then ranked by the exact distance to the full vectors
+HYBRID_RESCORE_SEARCH_QUERY = """
+    WITH keyword_matches AS MATERIALIZED ({keyword_matches}),
+    query_vectors AS (
+        SELECT query_index - 1 as query_index, vector_text::vector as embedding, short_text::{short_type} as short_embedding
+        FROM unnest(%(vectors)s::text[], %(short_vectors)s::text[]) WITH ORDINALITY as q(vector_text, short_text, query_index)
+    )
+    SELECT
+        qv.query_index,
+        r.column_name,
+        r.description,
+        r.rank,
+        r.distance,
+        cardinality(r.matched_keywords) as match_count,
+        r.matched_keywords
+    FROM
+        query_vectors qv
+    CROSS JOIN LATERAL (
+        SELECT
+            c.column_name,
+            c.description,
+            c.embedding <=> qv.embedding as distance,
+            c.matched_keywords,
+            row_number() OVER (ORDER BY c.embedding <=> qv.embedding) as rank
+        FROM (
+            SELECT
+                ce.column_name,
+                ce.description,
+                ce.embedding,
+                COALESCE(km.matched_keywords, '{{}}') as matched_keywords
+            FROM
+                public.column_embeddings ce
+            LEFT JOIN keyword_matches km ON km.id = ce.id
+            WHERE
+                km.id IS NOT NULL OR NOT EXISTS (SELECT 1 FROM keyword_matches)
+            ORDER BY
+                subvector(ce.embedding, 1, {dimensions})::{short_type} <=> qv.short_embedding
+            LIMIT %(candidates)s
+        ) c
+        ORDER BY
+            distance
+        LIMIT %(limit)s
+    ) r
+    ORDER BY
+        qv.query_index, r.rank;
+"""
+
+def _hybrid_search_statement(keyword_source: str, embedding_format: EmbeddingFormat, embeddings: list[list[float]]) -> tuple:
+    """Returns the hybrid search SQL for the embedding format and its vector parameters."""
+    keyword_matches = KEYWORD_MATCH_QUERIES[keyword_source]
+    params = {"vectors": [vector_literal(embedding) for embedding in embeddings]}
+    if embedding_format is None or embedding_format.is_exact:
+        return HYBRID_SEARCH_QUERY.format(keyword_matches=keyword_matches), params
+    if embedding_format.precision == "int8":
+        raise ValueError("pgvector has no int8 vector type; use float16 (halfvec) or the local search backend")
+    dimensions = embedding_format.dimensions or EMBEDDING_DIMENSIONS
+    short_type = f"halfvec({dimensions})" if embedding_format.precision == "float16" else f"vector({dimensions})"
+    params["short_vectors"] = [vector_literal(vector) for vector in embedding_format.truncate(embeddings)]
+    params["candidates"] = embedding_format.candidates
+    return HYBRID_RESCORE_SEARCH_QUERY.format(keyword_matches=keyword_matches, dimensions=int(dimensions), short_type=short_type), params
+
+def hybrid_search(embeddings: list[list[float]], user_keywords: list[str], conn, limit: int = 25,
+                  keyword_source: str = "array", keyword_index: KeywordIndex = None,
+                  embedding_format: EmbeddingFormat = None) -> list[list[tuple]]:
+    """
+    Performs the keyword prefilter and the vector similarity search for every
+    embedding in a single statement. Returns one ranked list per embedding of
+    (column_name, description, rank, distance, match_count, matched_keywords) rows.
+    keyword_source selects how keywords are matched: "array", "table", or "memory"
+    (which requires keyword_index). A non-exact embedding_format searches candidates
+    on truncated or halfvec vectors and rescores them against the full ones.
+    """
+    if not embeddings:
+        return []
+    keyword_matches = {}
+    if keyword_source == "memory":
+        keyword_matches = {
+            column_name: (match_count, matched_keywords)
+            for column_name, match_count, matched_keywords in keyword_index.search(user_keywords)
+        }
+
+    query, params = _hybrid_search_statement(keyword_source, embedding_format, embeddings)
+    with conn.cursor() as cursor:
+        cursor.execute(query, {
+            "keywords": user_keywords,
+            "columns": list(keyword_matches),
+            "limit": limit,
+            **params,
+        })
+
+        results = [[] for _ in embeddings]
+        for query_index, *row in cursor.fetchall():
+            if keyword_source == "memory":
+                row[4:6] = keyword_matches.get(row[0], (0, []))
+            results[query_index].append(tuple(row))
+        return results
@@ -0,0 +1,119 @@
+"""
+Compact schema context for the reformulation prompt.
+
+Every column is rendered on one short line, "name (Type): sample; sample", from either the
+static ALL_COLUMNS registry or the data_type and sample columns of public.column_embeddings.
+The context can be pruned to the columns the keyword prefilter matched.
+
+    python schema_context.py "which companies are GMP certified"
+
+prints the prompt token counts of the full and the compact (and pruned) prompts, and how
+much of each repeats between queries and can be served from the provider's prompt cache.
+"""
+from functools import lru_cache
+
+from cached_resource import CachedResource
+from helpers.pre_process_data import pre_process_sample
+
+SAMPLE_ITEMS = 3
+SAMPLE_ITEM_CHARS = 30
+
+def parse_column_entry(entry: str) -> tuple:
+    """Splits an ALL_COLUMNS entry ("name - Type - 'a\\nb'") into (name, data_type, sample values)."""
+    name, data_type, sample = (entry.split(" - ", 2) + ["", ""])[:3]
+    sample = sample.strip().strip("'\"")
+    return name.strip(), data_type.strip(), [item for item in sample.split("\\n") if item.strip()]
+
+def compact_sample(values: list, items: int = SAMPLE_ITEMS, item_chars: int = SAMPLE_ITEM_CHARS) -> str:
+    """Keeps the first few preprocessed sample values, each truncated to item_chars characters."""
+    kept = [str(value).strip().strip("'\"") for value in pre_process_sample(list(values))[:items]]
+    return "; ".join(value if len(value) <= item_chars else value[:item_chars - 1] + "…" for value in kept)
+
+class SchemaContext:
+    """The compact one-line descriptions of every column of the catalog, in a stable order."""
+    def __init__(self, columns: list[tuple]):
+        self.lines = {}
+        for name, data_type, values in sorted(columns):
+            sample = compact_sample(values) if values else ""
+            self.lines[name] = f"{name} ({data_type}): {sample}" if sample else f"{name} ({data_type})"
+
+    @classmethod
+    def from_registry(cls, all_columns: list[str]) -> "SchemaContext":
+        return cls([parse_column_entry(entry) for entry in all_columns])
+
+    @classmethod
+    def from_connection(cls, conn) -> "SchemaContext":
+        """Builds the context from the data_type and sample columns written by helpers/ingest_catalog.py."""
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT column_name, coalesce(data_type, ''), coalesce(sample, '{}') FROM public.column_embeddings;")
+            columns = cursor.fetchall()
+        conn.rollback()
+        return cls(columns)
+
+    def render(self, candidates: list[str] = None) -> str:
+        """
+        Returns the context of every column, or of the given candidate columns only.
+        Lines keep the catalog order whatever the candidate order, so equal candidate
+        sets always render the same text.
+        """
+        if candidates:
+            candidates = set(candidates)
+            lines = [line for name, line in self.lines.items() if name in candidates]
+            if lines:
+                return "\n".join(lines)
+        return "\n".join(self.lines.values())
+
+class CachedSchemaContext(CachedResource):
+    """Holds one SchemaContext per process and rebuilds it from the database every refresh_interval seconds."""
+    def __init__(self, refresh_interval: float = 300):
+        super().__init__(SchemaContext.from_connection, refresh_interval)
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when it is installed, otherwise estimates them at 4 characters per token."""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def main() :
+    """Prints the reformulation prompt token counts with the full and the compact schema context, and the prefix they repeat."""
+    import argparse
+    from retrieval import (ALL_COLUMNS, PROMPT_CACHE_MIN_TOKENS, REFORMULATION_CONTEXT_TEMPLATE,
+                           build_reformulation_messages, full_schema_text)
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("query", nargs="?", default="which companies are GMP certified")
+    parser.add_argument("--candidates", nargs="*", help="prune the context to these columns")
+    args = parser.parse_args()
+
+    context = SchemaContext.from_registry(ALL_COLUMNS)
+    variants = {
+        "full": full_schema_text(),
+        "compact": context.render(),
+    }
+    if args.candidates:
+        variants["compact_pruned"] = context.render(args.candidates)
+
+    for name, schema_text in variants.items():
+        messages = build_reformulation_messages(args.query, schema_text)
+        static, dynamic = (count_tokens(message["content"]) for message in messages)
+        print(f"{name:<15} {static + dynamic:>6} prompt tokens ({static} static prefix, {dynamic} per query)")
+        # A pruned context differs between queries, so only the system prompt repeats
+        repeated = static
+        if name != "compact_pruned":
+            repeated += count_tokens(REFORMULATION_CONTEXT_TEMPLATE.partition("{user_input}")[0].format(all_columns=schema_text))
+        cached = "cacheable" if repeated >= PROMPT_CACHE_MIN_TOKENS else f"below the {PROMPT_CACHE_MIN_TOKENS}-token caching minimum"
+        print(f"{'':<15} {repeated:>6} tokens repeated between queries ({cached})")
+    if _encoding() is None:
+        print("tiktoken is not installed; token counts are estimated at 4 characters per token")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+"""
+The column search pipeline as an importable engine, independent of Streamlit.
+
+    engine = SearchEngine.from_settings(os.environ)
+    result = engine.search("where is the company located")
+    results = engine.search_many(queries)
+
+With RESULT_CACHE_ENABLED set, repeated queries are answered from the result cache until
+the catalog changes; the cache needs the updated_at column of helpers/SQL_Queries.SQL.
+
+Run as a script to search every query of a JSONL file and write the ranked results as JSONL:
+
+    python search_engine.py queries.jsonl --output results.jsonl
+"""
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import retrieval
+from db_pool import ConnectionPool
+from disk_cache import DiskCache
+from embedding_format import EmbeddingFormat
+from fusion import fuse_results
+from instrumentation import Trace
+from keyword_index import CachedKeywordIndex
+from local_index import LocalVectorIndex
+from metadata_filter import extract_unique_words_advanced, normalize_query
+from query_planner import QueryPlanner
+from result_cache import ResultCache
+from schema_context import CachedSchemaContext
+from singleflight import SingleFlight
+from search_pipeline import run_search_pipeline, run_streaming_search_pipeline
+from startup import create_openai_client, flag, timed
+
+EMBEDDING_BATCH_SIZE = 512
+
+logger = logging.getLogger("search.engine")
+
+class SearchEngine:
+    """
+    Runs searches against one set of shared resources: the OpenAI client, the
+    reformulation cache, the embedding store and the pooled database connections.
+    Safe to use from many threads at once.
+    """
+    def __init__(self, client, db_pool: ConnectionPool, reformulation_cache: DiskCache = None,
+                 embedding_store: DiskCache = None, search_backend: str = "pgvector", keyword_source: str = "array",
+                 keyword_index: CachedKeywordIndex = None, local_index: LocalVectorIndex = None,
+                 result_limit: int = 15, fusion_method: str = "rrf", keyword_weight: float = 1.0,
+                 cache_use_keywords: bool = False, max_workers: int = 8,
+                 schema_context: CachedSchemaContext = None, schema_top_k: int = 0, planner: QueryPlanner = None,
+                 embedding_format: EmbeddingFormat = None, result_cache: ResultCache = None):
+        self.client = client
+        self.db_pool = db_pool
+        self.reformulation_cache = reformulation_cache
+        self.embedding_store = embedding_store
+        self.search_backend = search_backend
+        self.keyword_source = keyword_source
+        self.keyword_index = keyword_index
+        self.local_index = local_index
+        self.result_limit = result_limit
+        self.fusion_method = fusion_method
+        self.keyword_weight = keyword_weight
+        self.cache_use_keywords = cache_use_keywords
+        self.max_workers = max_workers
+        self.schema_context = schema_context
+        self.schema_top_k = schema_top_k
+        self.planner = planner
+        self.embedding_format = embedding_format
+        self.result_cache = result_cache
+        self.flights = SingleFlight()
+
+    @classmethod
+    def from_settings(cls, settings) -> "SearchEngine":
+        """Builds the engine from a mapping such as st.secrets or os.environ."""
+        with timed("openai_client"):
+            client = create_openai_client(settings["OPENAI_API_KEY"])
+        search_backend = settings.get("SEARCH_BACKEND", "pgvector")
+        keyword_source = settings.get("KEYWORD_MATCH_SOURCE", "array")
+        schema_top_k = int(settings.get("SCHEMA_TOP_K", 0))
+        planner = QueryPlanner.from_settings(settings) if flag(settings.get("PLANNER_ENABLED", False)) else None
+        embedding_format = EmbeddingFormat.from_settings(settings)
+        if search_backend != "local" and embedding_format.precision == "int8":
+            raise ValueError("EMBEDDING_SEARCH_PRECISION int8 needs SEARCH_BACKEND local: pgvector has no int8 vector type")
+        return cls(
+            client,
+            ConnectionPool(
+                settings["DB_URL"],
+                minconn=int(settings.get("DB_POOL_MIN_SIZE", 1)),
+                maxconn=int(settings.get("DB_POOL_MAX_SIZE", 10)),
+                max_lifetime=float(settings.get("DB_POOL_MAX_LIFETIME", 1800)),
+            ),
+            reformulation_cache=DiskCache(
+                settings.get("REFORMULATION_CACHE_PATH", ".cache/reformulations.sqlite3"),
+                table="reformulations",
+                max_entries=int(settings.get("REFORMULATION_CACHE_MAX_ENTRIES", 10000)),
+                ttl=float(settings.get("REFORMULATION_CACHE_TTL", 7 * 24 * 3600)),
+            ),
+            embedding_store=DiskCache(
+                settings.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3"),
+                table="embeddings",
+                max_entries=int(settings.get("EMBEDDING_CACHE_MAX_ENTRIES", 50000)),
+            ),
+            search_backend=search_backend,
+            keyword_source=keyword_source,
+            keyword_index=CachedKeywordIndex(
+                refresh_interval=float(settings.get("KEYWORD_INDEX_REFRESH_INTERVAL", 60))
+            ) if keyword_source == "memory" or schema_top_k or planner else None,
+            local_index=LocalVectorIndex(
+                settings.get("LOCAL_INDEX_PATH", ".cache/column_index"),
+                refresh_interval=float(settings.get("LOCAL_INDEX_REFRESH_INTERVAL", 60)),
+                embedding_format=embedding_format,
+            ) if search_backend == "local" else None,
+            result_limit=int(settings.get("RESULT_LIMIT", 15)),
+            fusion_method=settings.get("FUSION_METHOD", "rrf"),
+            keyword_weight=float(settings.get("FUSION_KEYWORD_WEIGHT", 1.0)),
+            cache_use_keywords=flag(settings.get("REFORMULATION_CACHE_USE_KEYWORDS", False)),
+            max_workers=int(settings.get("SEARCH_MAX_WORKERS", 8)),
+            schema_context=CachedSchemaContext(
+                refresh_interval=float(settings.get("SCHEMA_CONTEXT_REFRESH_INTERVAL", 300))
+            ) if settings.get("SCHEMA_SOURCE", "registry") == "database" else None,
+            schema_top_k=schema_top_k,
+            planner=planner,
+            embedding_format=embedding_format,
+            result_cache=ResultCache(
+                max_entries=int(settings.get("RESULT_CACHE_MAX_ENTRIES", 10000)),
+                ttl=float(settings.get("RESULT_CACHE_TTL", 3600)),
+                check_interval=float(settings.get("RESULT_CACHE_CHECK_INTERVAL", 5)),
+            ) if flag(settings.get("RESULT_CACHE_ENABLED", False)) else None,
+        )
+
+    def extract_keywords(self, texts: list[str]) -> list[str]:
+        return extract_unique_words_advanced(texts)
+
+    def schema_text(self, user_input: str) -> str:
+        """
+        Renders the column context for the prompt, from ALL_COLUMNS or the database (SCHEMA_SOURCE).
+        With schema_top_k set it is pruned to the columns matching most of the query keywords.
+        """
+        if self.schema_context is not None:
+            context = self.schema_context.get(self.db_pool.connection)
+        else:
+            context = retrieval.default_schema_context()
+        if not self.schema_top_k:
+            return context.render()
+        matches = self.keyword_index.get(self.db_pool.connection).search(self.extract_keywords([user_input]))
+        return context.render([column_name for column_name, _, _ in matches[:self.schema_top_k]])
+
+    def reformulate(self, user_input: str) -> list[str]:
+        """Reformulates the query, sharing the result with concurrent calls for the same normalized query and context."""
+        schema_text = self.schema_text(user_input)
+        return self.flights.do(
+            "reformulate", retrieval.reformulation_cache_key(user_input, self.cache_use_keywords, schema_text),
+            lambda: retrieval.reformulate_for_query(user_input, self.client, self.reformulation_cache,
+                                                    self.cache_use_keywords, schema_text=schema_text),
+        )
+
+    def stream_reformulation(self, user_input: str):
+        """Streams the reformulation; concurrent calls for the same query receive the descriptions of the one in flight."""
+        schema_text = self.schema_text(user_input)
+        return self.flights.do_iter(
+            "reformulate", retrieval.reformulation_cache_key(user_input, self.cache_use_keywords, schema_text),
+            lambda: retrieval.stream_reformulation(user_input, self.client, self.reformulation_cache,
+                                                   self.cache_use_keywords, schema_text=schema_text),
+        )
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embeds the texts, waiting on the embeddings other calls already have in flight instead of requesting them again."""
+        return self.flights.do_many(
+            "embed", texts, lambda missing: retrieval.get_embeddings(missing, self.client, self.embedding_store)
+        )
+
+    def search_columns(self, embeddings: list[list[float]], user_keywords: list[str]) -> list[list[tuple]]:
+        """Runs the hybrid search, sharing the rows with concurrent searches for the same vectors and keywords."""
+        digest = hashlib.sha256(np.asarray(embeddings, dtype=np.float32).tobytes())
+        digest.update(json.dumps(sorted(user_keywords)).encode("utf-8"))
+        return self.flights.do("search", digest.hexdigest(), lambda: self._search_columns(embeddings, user_keywords))
+
+    def _search_columns(self, embeddings: list[list[float]], user_keywords: list[str]) -> list[list[tuple]]:
+        """Runs the hybrid search on the configured backend: pgvector (default) or the local index."""
+        if self.search_backend == "local":
+            self.local_index.refresh_if_stale(self.db_pool.connection)
+            return self.local_index.hybrid_search(embeddings, user_keywords)
+        keyword_index = self.keyword_index.get(self.db_pool.connection) if self.keyword_source == "memory" else None
+        with self.db_pool.connection() as conn:
+            return retrieval.hybrid_search(embeddings, user_keywords, conn, keyword_source=self.keyword_source,
+                                           keyword_index=keyword_index, embedding_format=self.embedding_format)
+
+    def describe_columns(self, column_names: list[str]) -> dict:
+        """Returns the descriptions of the given columns from the configured backend."""
+        if self.search_backend == "local":
+            self.local_index.refresh_if_stale(self.db_pool.connection)
+            return self.local_index.describe(column_names)
+        with self.db_pool.connection() as conn:
+            return retrieval.get_column_descriptions(column_names, conn)
+
+    def keyword_tier(self, query: str, keywords: list[str]) -> list[tuple]:
+        """Tier 1: answers from an exact column name or the keyword index, or returns None to escalate."""
+        index = self.keyword_index.get(self.db_pool.connection)
+        matches = self.planner.keyword_tier(query, index.search(keywords), index.column_ids)
+        if matches is None:
+            return None
+        matches = matches[:self.result_limit]
+        descriptions = self.describe_columns([column_name for column_name, _, _ in matches])
+        return [
+            (column_name, descriptions.get(column_name, ""), rank, None, match_count, matched_keywords, float(match_count))
+            for rank, (column_name, match_count, matched_keywords) in enumerate(matches, 1)
+        ]
+
+    def raw_query_tier(self, embedding: list[float], keywords: list[str]) -> list[tuple]:
+        """Tier 2: answers from the embedding of the raw query, or returns None to escalate."""
+        ranked = self.search_columns([embedding], keywords)[0]
+        return self.fuse([ranked]) if self.planner.vector_confident(ranked) else None
+
+    def _plan(self, query: str, trace: Trace):
+        """Tries the tiers that skip the LLM. Returns (tier, keywords, results) or None."""
+        with trace.span("tier_1_keywords"):
+            keywords = self.extract_keywords([query])
+            results = self.keyword_tier(query, keywords)
+        if results is not None:
+            return 1, keywords, results
+        with trace.span("tier_2_raw_query"):
+            results = self.raw_query_tier(self.embed([query])[0], keywords)
+        if results is not None:
+            return 2, keywords, results
+        return None
+
+    def fuse(self, results_from_all_descriptions: list[list[tuple]]) -> list[tuple]:
+        """Merges the ranked lists of every description with the configured fusion method."""
+        return fuse_results(results_from_all_descriptions, limit=self.result_limit,
+                            method=self.fusion_method, keyword_weight=self.keyword_weight)
+
+    def result_cache_key(self, query: str) -> str:
+        return normalize_query(query, use_keywords=self.cache_use_keywords)
+
+    def invalidate_indexes(self) -> None:
+        """Marks the in-process copies of the catalog stale, so the next search rebuilds them."""
+        for index in (self.keyword_index, self.local_index, self.schema_context):
+            if index is not None:
+                index.invalidate()
+
+    def cached_results(self, queries: list[str]) -> dict:
+        """
+        Returns the cached results of the given queries that are present, after checking the
+        catalog version. A new version also marks the in-process indexes stale.
+        """
+        if self.result_cache is None:
+            return {}
+        self.result_cache.refresh_if_stale(self.db_pool.connection, on_change=self.invalidate_indexes)
+        found = {}
+        for query in queries:
+            cached = self.result_cache.get(self.result_cache_key(query))
+            if cached is not None:
+                found[query] = {**cached, "query": query, "cached": True}
+        return found
+
+    def cache_result(self, result: dict, generation: int) -> None:
+        """Stores a result computed in the given cache generation, unless the catalog changed since."""
+        if self.result_cache is not None:
+            self.result_cache.set(self.result_cache_key(result["query"]), result,
+                                  [row[0] for row in result["results"]], result["keywords"], generation)
+
+    def search(self, query: str, stream: bool = False, on_result=None, trace: Trace = None) -> dict:
+        """
+        Searches one query, timing every stage on trace. With stream set, each description
+        is searched as soon as the LLM has written it and on_result is called with the
+        fused results so far after every search. With a planner, the keyword and raw query
+        tiers are tried first and the LLM is only called when neither is confident.
+        A query already in the result cache returns its stored results straight away; if the
+        cache cannot be checked, the query is searched without it.
+        Returns a dict of the query, the tier that answered, whether it was cached, keywords,
+        descriptions and fused results.
+        """
+        trace = trace or Trace(query)
+        with trace.span("total") as total:
+            with trace.span("result_cache"):
+                try:
+                    cached = self.cached_results([query]).get(query)
+                    generation = self.result_cache.generation if self.result_cache is not None else None
+                except Exception:
+                    logger.exception("Result cache lookup failed, searching without it")
+                    cached, generation = None, None
+            if cached is not None:
+                total["counts"]["result_cache_hit"] = 1
+                return cached
+            if generation is not None:
+                total["counts"]["result_cache_miss"] = 1
+            result = self._search(query, stream, on_result, trace, total)
+        if generation is not None:
+            self.cache_result(result, generation)
+        return result
+
+    def _search(self, query: str, stream: bool, on_result, trace: Trace, total: dict) -> dict:
+        extract_keywords = trace.wrap("keyword_expansion", self.extract_keywords, lambda keywords: {"keywords": len(keywords)})
+        embed = trace.wrap("embed", self.embed)
+        search = trace.wrap("search", self.search_columns, lambda results: {"rows": sum(len(res) for res in results)})
+
+        planned = self._plan(query, trace) if self.planner is not None else None
+        if planned is not None:
+            tier, keywords, results = planned
+            total["counts"][f"tier_{tier}"] = 1
+            return {"query": query, "tier": tier, "cached": False, "keywords": keywords, "descriptions": [], "results": results}
+
+        total["counts"]["tier_3"] = 1
+        if stream:
+            keywords, descriptions, results_lists = run_streaming_search_pipeline(
+                query,
+                extract_keywords=extract_keywords,
+                stream_descriptions=trace.wrap_iter("reformulate", self.stream_reformulation, "descriptions"),
+                embed=embed,
+                search=search,
+                on_result=None if on_result is None else trace.wrap(
+                    "partial_result", lambda descriptions, results: on_result(self.fuse(results))
+                ),
+            )
+        else:
+            keywords, descriptions, results_lists = run_search_pipeline(
+                query,
+                extract_keywords=extract_keywords,
+                reformulate=trace.wrap("reformulate", self.reformulate, lambda descriptions: {"descriptions": len(descriptions)}),
+                embed=embed,
+                search=search,
+            )
+        with trace.span("fuse") as span:
+            results = self.fuse(results_lists)
+            span["counts"]["rows"] = len(results)
+        return {"query": query, "tier": 3, "cached": False, "keywords": keywords, "descriptions": descriptions, "results": results}
+
+    def _embed_all(self, texts: list[str], executor: ThreadPoolExecutor, errors: dict = None) -> dict:
+        """
+        Embeds the distinct texts in batched calls, returning a dictionary of text to embedding.
+        With errors given, the texts of a failed batch are recorded there with the error
+        instead of raising, and are missing from the result.
+        """
+        texts = list(dict.fromkeys(texts))
+        vectors = {}
+        chunks = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+        for chunk, future in [(chunk, executor.submit(self.embed, chunk)) for chunk in chunks]:
+            try:
+                vectors.update(zip(chunk, future.result()))
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.update(dict.fromkeys(chunk, _error_message(e)))
+        return vectors
+
+    def iter_search_many(self, queries: list[str], batch_size: int = 256):
+        """
+        Searches many queries, yielding (query, result) pairs in input order, one batch at a time.
+        Identical queries are searched once, cached queries not at all, and every stage runs
+        concurrently across the batch.
+        With a planner, the raw queries needing tier 2 are embedded together and only the
+        queries no cheaper tier answered are reformulated. Descriptions shared between queries
+        are embedded once in batched calls, and the searches share the pooled database connections.
+        A query failing at any stage gets a result with an "error" message and no results,
+        and the rest of the batch carries on.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="search-many") as executor:
+            for start in range(0, len(queries), batch_size):
+                batch = queries[start:start + batch_size]
+                unique = [query for query in dict.fromkeys(batch) if query not in results]
+                try:
+                    results.update(self.cached_results(unique))
+                except Exception:
+                    logger.exception("Result cache lookup failed, searching the batch without it")
+                generation = self.result_cache.generation if self.result_cache is not None else None
+                unique = [query for query in unique if query not in results]
+                errors = {}
+
+                def guarded(stage):
+                    """Runs stage(query), recording its error instead of raising."""
+                    def run(query):
+                        try:
+                            return stage(query)
+                        except Exception as e:
+                            errors[query] = _error_message(e)
+                            return None
+                    return run
+
+                def failed(query, texts=()):
+                    """Whether the query, or one of the texts it was embedded from, has failed."""
+                    for key in (query, *texts):
+                        if key in errors:
+                            errors.setdefault(query, errors[key])
+                            return True
+                    return False
+
+                keywords = dict(zip(unique, executor.map(guarded(lambda query: self.extract_keywords([query])), unique)))
+
+                def answered(query, tier, query_results, descriptions=()):
+                    results[query] = {"query": query, "tier": tier, "cached": False, "keywords": keywords[query],
+                                      "descriptions": list(descriptions), "results": query_results}
+                    self.cache_result(results[query], generation)
+
+                pending = [query for query in unique if not failed(query)]
+                if self.planner is not None:
+                    tier_1 = executor.map(guarded(lambda query: self.keyword_tier(query, keywords[query])), pending)
+                    for query, query_results in zip(pending, tier_1):
+                        if query_results is not None:
+                            answered(query, 1, query_results)
+                    pending = [query for query in pending if query not in results and not failed(query)]
+
+                    raw_vectors = self._embed_all(pending, executor, errors)
+                    pending = [query for query in pending if not failed(query)]
+                    tier_2 = executor.map(guarded(lambda query: self.raw_query_tier(raw_vectors[query], keywords[query])), pending)
+                    for query, query_results in zip(pending, tier_2):
+                        if query_results is not None:
+                            answered(query, 2, query_results)
+                    pending = [query for query in pending if query not in results and not failed(query)]
+
+                descriptions = dict(zip(pending, executor.map(guarded(self.reformulate), pending)))
+                pending = [query for query in pending if not failed(query)]
+                vectors = self._embed_all([text for query in pending for text in descriptions[query]], executor, errors)
+                pending = [query for query in pending if not failed(query, descriptions[query])]
+
+                def search_one(query):
+                    results_lists = self.search_columns([vectors[text] for text in descriptions[query]], keywords[query])
+                    return self.fuse(results_lists)
+
+                for query, query_results in zip(pending, executor.map(guarded(search_one), pending)):
+                    if not failed(query):
+                        answered(query, 3, query_results, descriptions[query])
+                for query, error in errors.items():
+                    if query in unique and query not in results:
+                        results[query] = {"query": query, "tier": None, "cached": False, "keywords": keywords.get(query) or [],
+                                          "descriptions": list(descriptions.get(query) or []), "results": [], "error": error}
+                for query in batch:
+                    yield query, results[query]
+
+    def search_many(self, queries: list[str], batch_size: int = 256) -> list[dict]:
+        """Searches many queries and returns one result per query, in input order."""
+        return [result for _, result in self.iter_search_many(queries, batch_size)]
+
+def _error_message(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
+
+def result_record(result: dict) -> dict:
+    """Converts a search result into a JSON serializable record."""
+    return {
+        "query": result["query"],
+        "tier": result["tier"],
+        "cached": result.get("cached", False),
+        "keywords": list(result["keywords"]),
+        "descriptions": result["descriptions"],
+        **({"error": result["error"]} if "error" in result else {}),
+        "results": [
+            {"rank": rank, "column_name": column_name, "score": score, "distance": distance,
+             "match_count": match_count, "matched_keywords": sorted(set(matched_keywords))}
+            for rank, (column_name, _, _, distance, match_count, matched_keywords, score) in enumerate(result["results"], 1)
+        ],
+    }
+
+def main() :
+    """Searches every query of a JSONL file and writes the ranked results as JSONL."""
+    import argparse
+    import sys
+    from dotenv import load_dotenv
+    from metadata_filter import warm_up
+    from startup import ensure_nltk_data
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("queries", help='JSONL file with one {"query": ...} object (or JSON string) per line')
+    parser.add_argument("--output", help="JSONL file to write, stdout by default")
+    parser.add_argument("--batch-size", type=int, default=256, help="queries searched together")
+    parser.add_argument("--workers", type=int, help="concurrent searches, SEARCH_MAX_WORKERS by default")
+    args = parser.parse_args()
+
+    load_dotenv()
+    ensure_nltk_data(allow_download=flag(os.environ.get("NLTK_ALLOW_DOWNLOAD", False)))
+    # Load the expansion engine before the worker threads share it
+    with timed("keyword_warm_up"):
+        warm_up(os.environ.get("KEYWORD_LEXICON_PATH", "keyword_lexicon.json"))
+    engine = SearchEngine.from_settings(os.environ)
+    if args.workers:
+        engine.max_workers = args.workers
+
+    records = []
+    with open(args.queries) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                records.append(record if isinstance(record, dict) else {"query": record})
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        queries = [record["query"] for record in records]
+        for record, (_, result) in zip(records, engine.iter_search_many(queries, args.batch_size)):
+            output.write(json.dumps({**record, **result_record(result)}) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        engine.db_pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+def run_search_pipeline(user_input: str, extract_keywords, reformulate, embed, search):
+    """
+    Runs the search stages with the independent ones overlapped.
+    The keyword expansion runs on a worker thread while the LLM reformulation
+    runs on the calling thread, so the search only waits for the slower of the
+    two before embedding the descriptions and querying the database.
+    Returns the user keywords, the query descriptions and one ranked result list per description.
+    """
+    keywords_future = _executor.submit(extract_keywords, [user_input])
+    try:
+        query_descriptions = reformulate(user_input)
+    except Exception:
+        keywords_future.cancel()
+        raise
+
+    results_from_all_descriptions = []
+    if query_descriptions:
+        embeddings = embed(query_descriptions)
+        results_from_all_descriptions = search(embeddings, keywords_future.result())
+    return keywords_future.result(), query_descriptions, results_from_all_descriptions
+
+def run_streaming_search_pipeline(user_input: str, extract_keywords, stream_descriptions, embed, search, on_result=None):
+    """
+    Searches each description as soon as the streaming reformulation completes it.
+    Every description is embedded and searched on a worker thread while the LLM keeps
+    writing. on_result is called on the calling thread with the descriptions and the
+    result lists gathered so far, in description order, every time a search finishes.
+    Returns the same values as run_search_pipeline.
+    """
+    keywords_future = _executor.submit(extract_keywords, [user_input])
+    query_descriptions = []
+    pending = {}
+    finished = {}
+
+    def search_description(description):
+        embeddings = embed([description])
+        return search(embeddings, keywords_future.result())[0]
+
+    def deliver(done):
+        for future in done:
+            finished[pending.pop(future)] = future.result()
+        if done and on_result is not None:
+            on_result(
+                [query_descriptions[i] for i in sorted(finished)],
+                [finished[i] for i in sorted(finished)],
+            )
+
+    try:
+        for description in stream_descriptions(user_input):
+            query_descriptions.append(description)
+            pending[_executor.submit(search_description, description)] = len(query_descriptions) - 1
+            deliver([future for future in pending if future.done()])
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            deliver(done)
+    except Exception:
+        for future in pending:
+            future.cancel()
+        raise
+
+    results_from_all_descriptions = [finished[i] for i in range(len(query_descriptions))]
+    return keywords_future.result(), query_descriptions, results_from_all_descriptions
@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import Future
+
+from instrumentation import add_counts
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the computation
+    and every caller arriving while it is in flight waits for it and shares its result
+    (or its exception). Nothing is kept once the call finishes, so this complements the
+    caches rather than replacing them. Keys are namespaced, with separate counters of
+    executed and coalesced calls per namespace.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _join(self, namespace: str, keys) -> tuple:
+        """Returns the keys this caller leads and the futures of all the keys."""
+        owned, calls = [], {}
+        with self._lock:
+            for key in keys:
+                call = self._calls.get((namespace, key))
+                if call is None:
+                    call = self._calls[(namespace, key)] = Future()
+                    owned.append(key)
+                calls[key] = call
+            counters = self._counters.setdefault(namespace, {"executed": 0, "coalesced": 0})
+            counters["executed"] += len(owned)
+            counters["coalesced"] += len(calls) - len(owned)
+        add_counts(coalesced=len(calls) - len(owned))
+        return owned, calls
+
+    def _leave(self, namespace: str, keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._calls.pop((namespace, key), None)
+
+    def do(self, namespace: str, key, func):
+        """Returns func(), or the result of the identical call already in flight."""
+        owned, calls = self._join(namespace, [key])
+        call = calls[key]
+        if not owned:
+            return call.result()
+        try:
+            result = func()
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            self._leave(namespace, owned)
+
+    def do_many(self, namespace: str, keys: list, func) -> list:
+        """
+        Returns one value per key. func(keys) computes the values of the keys nobody else
+        has in flight, in one call; the other keys wait for the calls computing them.
+        """
+        owned, calls = self._join(namespace, list(dict.fromkeys(keys)))
+        if owned:
+            try:
+                for key, value in zip(owned, func(owned)):
+                    calls[key].set_result(value)
+            except BaseException as e:
+                for key in owned:
+                    if not calls[key].done():
+                        calls[key].set_exception(e)
+                raise
+            finally:
+                self._leave(namespace, owned)
+        return [calls[key].result() for key in keys]
+
+    def do_iter(self, namespace: str, key, func):
+        """
+        Yields the items of the iterator func() returns. The first caller streams them as
+        they come; callers joining while it is in flight receive them all once it finishes.
+        """
+        owned, calls = self._join(namespace, [key])
+        call = calls[key]
+        if not owned:
+            yield from call.result()
+            return
+        items = []
+        try:
+            for item in func():
+                items.append(item)
+                yield item
+            call.set_result(items)
+        except GeneratorExit:
+            call.set_exception(RuntimeError("The coalesced stream was closed before it finished"))
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            self._leave(namespace, owned)
+
+    def stats(self) -> dict:
+        """Returns the executed and coalesced call counts of every namespace."""
+        with self._lock:
+            return {
+                namespace: {**counters, "in_flight": sum(1 for ns, _ in self._calls if ns == namespace)}
+                for namespace, counters in self._counters.items()
+            }
@@ -0,0 +1,99 @@
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_START = time.perf_counter()
+
+# Targets the startup timing report is checked against.
+COLD_START_TARGET_SECONDS = 1.5  # process start until the first page is rendered
+RERUN_OVERHEAD_TARGET_SECONDS = 0.05  # one script rerun that does not run a search
+
+NLTK_RESOURCES = {"wordnet": "corpora/wordnet", "omw-1.4": "corpora/omw-1.4"}
+
+_timings = {}
+_reruns = {"first_render": None, "last": None, "max": 0.0}
+_lock = threading.Lock()
+
+def flag(value) -> bool:
+    """Reads a boolean setting that may come from st.secrets (a bool) or the environment (a string)."""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+@contextmanager
+def timed(name: str):
+    """Records how long the enclosed startup step took under the given name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _timings[name] = time.perf_counter() - start
+
+def ensure_nltk_data(allow_download: bool = False) -> None:
+    """
+    Checks that the WordNet corpora are installed without touching the network.
+    Missing corpora are only downloaded when allow_download is set, and a failed
+    download raises immediately instead of letting the first query fail later.
+    """
+    import nltk
+
+    missing = []
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(package)
+    if not missing:
+        return
+    if not allow_download:
+        raise RuntimeError(
+            f"NLTK corpora {', '.join(missing)} are not installed. "
+            f"Run `python -m nltk.downloader {' '.join(missing)}` or enable NLTK_ALLOW_DOWNLOAD."
+        )
+
+    for package in missing:
+        nltk.download(package, quiet=True, raise_on_error=True)
+
+def create_openai_client(api_key: str):
+    """Imports the OpenAI SDK and builds the client on first use rather than at import time."""
+    import openai
+    return openai.OpenAI(api_key=api_key)
+
+def start_warm_up(lexicon_path: str = None) -> threading.Thread:
+    """Pre-warms the keyword expansion engine (lexicon, inflect, WordNet) on a background thread."""
+    def run():
+        from metadata_filter import warm_up
+        with timed("keyword_warm_up"):
+            warm_up(lexicon_path)
+
+    thread = threading.Thread(target=run, name="keyword-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def record_rerun(seconds: float) -> None:
+    """Records the duration of one script run; the first one also marks the first render."""
+    with _lock:
+        if _reruns["first_render"] is None:
+            _reruns["first_render"] = time.perf_counter() - PROCESS_START
+        else:
+            _reruns["max"] = max(_reruns["max"], seconds)
+        _reruns["last"] = seconds
+
+def startup_report() -> dict:
+    """Returns the startup step timings and how they compare with the cold start and rerun targets."""
+    with _lock:
+        first_render = _reruns["first_render"]
+        return {
+            "cold_start_seconds": first_render,
+            "cold_start_target_seconds": COLD_START_TARGET_SECONDS,
+            "last_rerun_seconds": _reruns["last"],
+            "max_rerun_seconds": _reruns["max"],
+            "rerun_target_seconds": RERUN_OVERHEAD_TARGET_SECONDS,
+            "within_targets": (
+                first_render is not None
+                and first_render <= COLD_START_TARGET_SECONDS
+                and _reruns["max"] <= RERUN_OVERHEAD_TARGET_SECONDS
+            ),
+            "steps": {name: round(seconds, 4) for name, seconds in _timings.items()},
+        }
@@ -0,0 +1,37 @@
+import random
+from collections import Counter
+
+from helpers.extract_keywords import ColumnProfiler, extract_unique_words_advanced, is_text_data, item_keywords
+
+VALUES = [f"city {i % 50}" for i in range(1000)] + ["123", "4.5", None, "  "] * 25
+
+def test_sample_is_the_same_whatever_the_row_order_and_chunking():
+    shuffled = list(VALUES)
+    random.Random(7).shuffle(shuffled)
+    first = ColumnProfiler(sample_size=20).consume(VALUES, chunk_size=64)
+    second = ColumnProfiler(sample_size=20).consume(shuffled, chunk_size=1000)
+    assert first.sample() == second.sample()
+    assert len(first.sample()) == 20
+    assert len(set(first.sample())) == 20
+    assert None not in first.sample() and "  " not in first.sample()
+
+def test_counts_and_text_decision_match_the_whole_column_checks():
+    profiler = ColumnProfiler().consume(VALUES, chunk_size=100)
+    assert (profiler.rows, profiler.valid, profiler.text) == (1100, 1050, 1000)
+    assert profiler.is_text() == is_text_data(VALUES)
+    assert not ColumnProfiler().consume(["1", "2", "x"]).is_text()
+
+def test_keywords_are_exact_while_the_summary_has_room():
+    profiler = ColumnProfiler(max_keywords=1000).consume(VALUES, chunk_size=100)
+    assert sorted(profiler.keywords()) == sorted(extract_unique_words_advanced(VALUES))
+    assert profiler.keyword_counts(1) == [("city", 1000)]
+
+def test_frequent_keywords_survive_a_bounded_summary():
+    values = ["common"] * 300 + ["frequent"] * 200 + [f"rare{i}" for i in range(500)]
+    random.Random(3).shuffle(values)
+    profiler = ColumnProfiler(max_keywords=10).consume(values, chunk_size=50)
+    counts = dict(profiler.keyword_counts())
+    assert len(counts) <= 10
+    assert {"common", "frequent"} <= set(counts)
+    true_counts = Counter(keyword for value in values for keyword in item_keywords(value))
+    assert all(true_counts[keyword] - len(values) / 10 <= count <= true_counts[keyword] for keyword, count in counts.items())
@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection: answers SELECT 1 until it is broken or closed."""
+    def __init__(self, registry: list):
+        self.closed = 0
+        self.broken = False
+        self.status = psycopg2.extensions.STATUS_READY
+        registry.append(self)
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        if self.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+
+    def rollback(self):
+        self.status = psycopg2.extensions.STATUS_READY
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def opened(monkeypatch):
+    connections = []
+    monkeypatch.setattr(db_pool.psycopg2, "connect", lambda dsn: FakeConnection(connections))
+    return connections
+
+def test_concurrent_checkouts_reuse_at_most_maxconn_connections(opened):
+    connection_pool = ConnectionPool("dsn", minconn=1, maxconn=4)
+    barrier = threading.Barrier(4)
+
+    def use():
+        with connection_pool.connection() as conn:
+            barrier.wait(5)
+            return conn
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for _ in range(5):
+            assert len({id(conn) for conn in executor.map(lambda _: use(), range(4))}) == 4
+
+    assert len(opened) == 4
+    assert not any(conn.closed for conn in opened)
+    assert connection_pool.stats() == {"max_size": 4, "open": 4, "in_use": 0, "idle": 4,
+                                       "waiting": 0, "created": 4, "recycled": 0}
+
+def test_broken_and_expired_connections_are_replaced_and_forgotten(opened):
+    connection_pool = ConnectionPool("dsn", minconn=1, maxconn=2, max_lifetime=60)
+    with connection_pool.connection() as first:
+        pass
+    first.broken = True
+    with connection_pool.connection() as second:
+        assert second is not first
+    assert first.closed
+
+    connection_pool.max_lifetime = 0
+    with connection_pool.connection() as third:
+        assert third is not second
+    assert second.closed
+    stats = connection_pool.stats()
+    assert (stats["open"], stats["idle"], stats["created"], stats["recycled"]) == (1, 1, 3, 2)
+
+def test_connection_closed_by_the_caller_is_not_reused(opened):
+    connection_pool = ConnectionPool("dsn", minconn=0, maxconn=2)
+    with connection_pool.connection() as conn:
+        conn.close()
+    assert connection_pool.stats()["open"] == 0
+    with connection_pool.connection() as conn:
+        assert not conn.closed
+    assert len(opened) == 2
+
+def test_checkout_times_out_when_every_connection_is_in_use(opened):
+    connection_pool = ConnectionPool("dsn", minconn=0, maxconn=1, checkout_timeout=0.05)
+    with connection_pool.connection():
+        with pytest.raises(psycopg2.pool.PoolError):
+            with connection_pool.connection():
+                pass
+    with connection_pool.connection():
+        pass
+
+def test_close_closes_idle_connections_and_those_returned_later(opened):
+    connection_pool = ConnectionPool("dsn", minconn=0, maxconn=2)
+    with connection_pool.connection() as busy:
+        with connection_pool.connection() as idle:
+            pass
+        connection_pool.close()
+        assert idle.closed and not busy.closed
+    assert busy.closed
+    assert connection_pool.stats()["open"] == 0
@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+import time
+
+from disk_cache import DiskCache
+
+def test_values_round_trip_and_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / "nested" / "cache.sqlite")
+    cache = DiskCache(path)
+    cache.set_many({"a": b"1", "b": b"2"})
+    cache.set("a", b"3")
+    assert cache.get_many(["a", "b", "missing", "a"]) == {"a": b"3", "b": b"2"}
+    assert DiskCache(path).get("b") == b"2"
+    assert DiskCache(path, table="other").get("b") is None
+    assert len(cache) == 2
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("a", b"1")
+    time.sleep(0.01)
+    cache.set("b", b"2")
+    time.sleep(0.01)
+    assert cache.get("a") == b"1"
+    time.sleep(0.01)
+    cache.set("c", b"3")
+    assert cache.get_many(["a", "b", "c"]) == {"a": b"1", "c": b"3"}
+
+def test_threads_use_their_own_connections(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"))
+    threads = [threading.Thread(target=cache.set_many, args=({f"{i}-{j}": b"x" for j in range(50)},)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache) == 200
+
+def test_expired_entries_are_missing_and_dropped(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), ttl=0.05)
+    cache.set("a", b"1")
+    assert cache.get("a") == b"1"
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    cache.set("b", b"2")
+    assert len(cache) == 1
+
+def test_cache_files_without_expiry_are_migrated(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)")
+        conn.execute("INSERT INTO cache VALUES ('a', x'31', 0)")
+    cache = DiskCache(path, ttl=60)
+    assert cache.get("a") == b"1"
+    cache.set("b", b"2")
+    assert cache.get_many(["a", "b"]) == {"a": b"1", "b": b"2"}
@@ -0,0 +1,32 @@
+import pytest
+
+from fusion import fuse_results
+
+FIRST = [("city", "d-city", 1, 0.10, 2, ["city", "town"]), ("country", "d-country", 2, 0.30, 1, ["country"])]
+SECOND = [("country", "d-country", 1, 0.05, 1, ["country"]), ("revenue", "d-revenue", 2, 0.50, 0, [])]
+
+def test_rrf_sums_reciprocal_ranks_and_keeps_the_best_rank_and_distance():
+    fused = fuse_results([FIRST, SECOND], keyword_weight=0)
+    assert [row[0] for row in fused] == ["country", "city", "revenue"]
+    country = fused[0]
+    assert country[:6] == ("country", "d-country", 1, 0.05, 1, ["country"])
+    assert country[6] == pytest.approx(1 / 62 + 1 / 61)
+
+def test_rrf_fuses_keyword_match_counts_as_one_more_ranking():
+    fused = {row[0]: row[6] for row in fuse_results([FIRST, SECOND], keyword_weight=1.0)}
+    assert fused["city"] == pytest.approx(1 / 61 + 1 / 61)
+    assert fused["country"] == pytest.approx(1 / 62 + 1 / 61 + 1 / 62)
+    assert fused["revenue"] == pytest.approx(1 / 62)
+
+def test_distance_method_normalizes_each_list_and_weights_lists():
+    fused = fuse_results([FIRST, SECOND], method="distance", weights=[2.0, 1.0], keyword_weight=0)
+    assert {row[0]: row[6] for row in fused} == {"city": 2.0, "country": pytest.approx(1.0), "revenue": 0.0}
+
+def test_limit_ties_and_empty_lists():
+    fused = fuse_results([[], [("b", "", 1, 0.2, 0, []), ("a", "", 1, 0.2, 0, [])]], limit=1, keyword_weight=0)
+    assert [row[0] for row in fused] == ["a"]
+    assert fuse_results([[], []]) == []
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        fuse_results([FIRST], method="borda")
@@ -0,0 +1,30 @@
+from retrieval import DESCRIPTION_MARKER, iter_descriptions
+
+TEXT = ("The column city holds the town of the customer.\n"
+        "The column country holds the nation.\n\n"
+        "The column revenue holds the total sales.")
+EXPECTED = [
+    "The column city holds the town of the customer.",
+    "The column country holds the nation.",
+    "The column revenue holds the total sales.",
+]
+
+def chunked(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def test_any_chunking_yields_the_same_descriptions_as_splitting_the_full_text():
+    full = [DESCRIPTION_MARKER + " " + desc.strip() for desc in TEXT.split(DESCRIPTION_MARKER) if desc.strip()]
+    assert full == EXPECTED
+    for size in (1, 3, 7, len(TEXT)):
+        assert list(iter_descriptions(chunked(TEXT, size))) == EXPECTED
+
+def test_descriptions_are_yielded_once_the_next_marker_arrives():
+    chunks = iter(["The column city holds", " the town. The col", "umn country", " holds the nation."])
+    descriptions = iter_descriptions(chunks)
+    assert next(descriptions) == "The column city holds the town."
+    assert next(chunks) == " holds the nation."
+    assert list(descriptions) == ["The column country"]
+
+def test_empty_and_blank_streams_yield_nothing():
+    assert list(iter_descriptions([])) == []
+    assert list(iter_descriptions(["  ", "\n"])) == []
@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+
+from keyword_index import CachedKeywordIndex, KeywordIndex
+
+COLUMNS = ["city", "country", "revenue", "notes"]
+KEYWORDS = [["city", "location", "town"], ["country", "location"], ["revenue", "sales"], None]
+
+def test_match_counts_count_distinct_matching_keywords_per_column():
+    index = KeywordIndex(COLUMNS, KEYWORDS)
+    assert index.match_counts(["location", "town", "town", "unknown"]).tolist() == [2, 1, 0, 0]
+    assert index.match_counts(["unknown"]).tolist() == [0, 0, 0, 0]
+    assert index.matched_keywords(0, ["town", "location"]) == ["location", "town"]
+
+def test_search_returns_matching_columns_by_match_count():
+    index = KeywordIndex(COLUMNS, KEYWORDS)
+    assert index.search(["location", "country", "sales"]) == [
+        ("country", 2, ["country", "location"]),
+        ("city", 1, ["location"]),
+        ("revenue", 1, ["sales"]),
+    ]
+    assert index.search([]) == []
+
+class FakeCatalog:
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.reads = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        self.reads += 1
+
+    def fetchall(self):
+        return self.rows
+
+def test_cached_index_is_rebuilt_after_the_refresh_interval():
+    catalog = FakeCatalog([("city", ["city"])])
+
+    @contextmanager
+    def connect():
+        yield catalog
+
+    cached = CachedKeywordIndex(refresh_interval=3600)
+    assert cached.get(connect).search(["city"]) == [("city", 1, ["city"])]
+    catalog.rows = [("town", ["city"])]
+    assert cached.get(connect).column_names == ["city"]
+    assert catalog.reads == 1
+
+    cached.refresh_interval = 0
+    assert cached.get(connect).column_names == ["town"]
+    assert catalog.reads == 2
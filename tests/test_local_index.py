@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+
+from embedding_format import EmbeddingFormat
+from local_index import LocalVectorIndex
+
+COLUMNS = [
+    ("city", "The city the customer lives in", ["city", "location"], [1.0, 0.0, 0.0, 0.0]),
+    ("country", "The country of the customer", ["country", "location"], [0.8, 0.6, 0.0, 0.0]),
+    ("revenue", "Total sales revenue", ["revenue", "sales"], [0.0, 0.0, 1.0, 0.0]),
+]
+
+class FakeCatalog:
+    """Answers the fingerprint and snapshot queries of LocalVectorIndex from a list of catalog rows."""
+    def __init__(self, rows: list, fingerprint: str):
+        self.rows = rows
+        self.fingerprint = fingerprint
+        self.snapshots_read = 0
+
+    def cursor(self, name=None):
+        self.named = name is not None
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        self.snapshots_read += self.named
+
+    def fetchone(self):
+        return len(self.rows), self.fingerprint
+
+    def __iter__(self):
+        return iter([(name, description, keywords, str(vector)) for name, description, keywords, vector in self.rows])
+
+    def rollback(self):
+        pass
+
+def test_hybrid_search_ranks_by_cosine_distance_among_keyword_matches():
+    index = LocalVectorIndex()
+    index.load_rows(*zip(*COLUMNS))
+    [rows] = index.hybrid_search([[2.0, 0.1, 0.0, 0.0]], ["location"], limit=5)
+    assert [row[0] for row in rows] == ["city", "country"]
+    assert [row[2] for row in rows] == [1, 2]
+    assert rows[0][3] < rows[1][3]
+    assert rows[0][4:] == (1, ["location"])
+
+def test_hybrid_search_searches_every_column_without_keyword_matches():
+    index = LocalVectorIndex()
+    index.load_rows(*zip(*COLUMNS))
+    [rows] = index.hybrid_search([[0.0, 0.1, 1.0, 0.0]], ["nothing"], limit=2)
+    assert [row[0] for row in rows] == ["revenue", "country"]
+    assert index.describe(["revenue", "missing"]) == {"revenue": "Total sales revenue"}
+
+def test_compact_format_rescores_candidates_with_the_full_vectors():
+    exact, compact = LocalVectorIndex(), LocalVectorIndex(embedding_format=EmbeddingFormat(dimensions=2, precision="float16"))
+    for index in (exact, compact):
+        index.load_rows(*zip(*COLUMNS))
+    query = [[0.9, 0.3, 0.2, 0.0]]
+    assert compact.hybrid_search(query, [], limit=3) == exact.hybrid_search(query, [], limit=3)
+
+def test_refresh_reuses_published_snapshots_and_removes_superseded_ones(tmp_path):
+    catalog = FakeCatalog(COLUMNS[:2], "v1")
+    index = LocalVectorIndex(snapshot_dir=str(tmp_path))
+    index.refresh(catalog)
+    assert os.listdir(tmp_path) == ["v1"]
+    assert isinstance(index._snapshot.matrix, np.memmap)
+
+    other_worker = LocalVectorIndex(snapshot_dir=str(tmp_path))
+    other_worker.refresh(catalog)
+    assert catalog.snapshots_read == 1
+
+    catalog.rows, catalog.fingerprint = COLUMNS, "v2"
+    index.refresh(catalog)
+    assert os.listdir(tmp_path) == ["v2"]
+    assert [row[0] for row in index.hybrid_search([[0.0, 0.0, 1.0, 0.0]], ["sales"])[0]] == ["revenue"]
+    assert [row[0] for row in other_worker.hybrid_search([[1.0, 0.0, 0.0, 0.0]], ["location"])[0]] == ["city", "country"]
@@ -0,0 +1,128 @@
+import hashlib
+from contextlib import contextmanager
+
+import psycopg2.errors
+
+from result_cache import ResultCache
+from search_engine import SearchEngine
+
+class FakeCatalog:
+    """Answers the two result cache queries from a dict of column_name -> (id, updated_at, keywords)."""
+    def __init__(self, columns: dict):
+        self.columns = columns
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        if "MAX(updated_at)" in query:
+            ids = ",".join(str(column_id) for column_id, _, _ in sorted(self.columns.values()))
+            self.rows = [(len(self.columns), hashlib.md5(ids.encode()).hexdigest(),
+                          max(updated_at for _, updated_at, _ in self.columns.values()))]
+        else:
+            self.rows = [(name, keywords) for name, (_, updated_at, keywords) in self.columns.items() if updated_at > params[0]]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def rollback(self):
+        pass
+
+def make_cache(columns: dict, **kwargs):
+    catalog = FakeCatalog(columns)
+
+    @contextmanager
+    def connect():
+        yield catalog
+
+    cache = ResultCache(check_interval=0, **kwargs)
+    cache.refresh_if_stale(connect)
+    return cache, catalog, connect
+
+CATALOG = {
+    "city": (1, 1, ["city", "town"]),
+    "country": (2, 1, ["country", "nation"]),
+    "revenue": (3, 1, ["revenue", "sales"]),
+}
+
+def fill(cache: ResultCache) -> None:
+    cache.set("where is the city", "r1", ["city", "country"], ["city", "where"])
+    cache.set("total sales", "r2", ["revenue"], ["sales", "total"])
+    cache.set("which nation", "r3", ["country"], ["nation", "which"])
+
+def test_updated_column_drops_the_entries_listing_it():
+    cache, catalog, connect = make_cache(dict(CATALOG))
+    fill(cache)
+    catalog.columns["revenue"] = (3, 2, ["revenue"])
+    cache.refresh_if_stale(connect)
+    assert cache.get("total sales") is None
+    assert cache.get("where is the city") == "r1"
+    assert cache.get("which nation") == "r3"
+
+def test_updated_column_drops_the_entries_matching_its_keywords():
+    cache, catalog, connect = make_cache(dict(CATALOG))
+    fill(cache)
+    catalog.columns["city"] = (1, 2, ["city", "nation"])
+    cache.refresh_if_stale(connect)
+    assert cache.get("where is the city") is None
+    assert cache.get("which nation") is None
+    assert cache.get("total sales") == "r2"
+
+def test_replaced_column_clears_the_cache_even_with_the_same_count():
+    cache, catalog, connect = make_cache(dict(CATALOG))
+    fill(cache)
+    del catalog.columns["country"]
+    catalog.columns["region"] = (4, 1, ["region"])
+    changes = []
+    cache.refresh_if_stale(connect, on_change=lambda: changes.append(1))
+    assert changes == [1]
+    assert all(cache.get(key) is None for key in ("where is the city", "total sales", "which nation"))
+    assert cache.stats()["flushes"] == 1
+
+def test_results_of_an_older_generation_are_discarded():
+    cache, catalog, connect = make_cache(dict(CATALOG))
+    generation = cache.generation
+    catalog.columns["revenue"] = (3, 2, ["revenue"])
+    cache.refresh_if_stale(connect)
+    cache.set("total sales", "stale", ["revenue"], ["sales"], generation)
+    assert cache.get("total sales") is None
+    cache.set("total sales", "fresh", ["revenue"], ["sales"], cache.generation)
+    assert cache.get("total sales") == "fresh"
+
+def test_unchanged_version_keeps_every_entry():
+    cache, _, connect = make_cache(dict(CATALOG))
+    fill(cache)
+    cache.refresh_if_stale(connect, on_change=lambda: (_ for _ in ()).throw(AssertionError("no change expected")))
+    assert cache.get("total sales") == "r2"
+    assert cache.stats()["hit_rate"] == 1.0
+
+def test_least_recently_used_entries_are_evicted():
+    cache, _, _ = make_cache(dict(CATALOG), max_entries=2)
+    fill(cache)
+    assert cache.get("where is the city") is None
+    assert cache.stats()["evicted"] == 1
+    cache.invalidate_columns({"revenue": []})
+    assert cache.get("total sales") is None
+    assert cache.get("which nation") == "r3"
+
+def test_search_carries_on_when_the_catalog_version_cannot_be_read():
+    class OldSchemaPool:
+        @contextmanager
+        def connection(self):
+            raise psycopg2.errors.UndefinedColumn('column "updated_at" does not exist')
+            yield
+
+    engine = SearchEngine(None, OldSchemaPool(), result_cache=ResultCache())
+    engine._search = lambda query, *args: {"query": query, "results": [], "keywords": []}
+    assert engine.search("total sales") == {"query": "total sales", "results": [], "keywords": []}
+    assert engine.result_cache.stats()["entries"] == 0
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the condition")
+        time.sleep(0.001)
+
+def coalesced(flights: SingleFlight, namespace: str) -> int:
+    return flights.stats().get(namespace, {}).get("coalesced", 0)
+
+def test_do_runs_once_for_concurrent_callers():
+    flights, release, calls = SingleFlight(), threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(flights.do, "ns", "key", compute)]
+        wait_for(lambda: calls)
+        futures += [executor.submit(flights.do, "ns", "key", compute) for _ in range(4)]
+        wait_for(lambda: coalesced(flights, "ns") == 4)
+        release.set()
+        assert [future.result(5) for future in futures] == ["result"] * 5
+    assert len(calls) == 1
+    assert flights.stats()["ns"] == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+def test_do_shares_the_leader_exception_and_releases_the_key():
+    flights, release, started = SingleFlight(), threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.do, "ns", "key", fail)
+        started.wait(5)
+        follower = executor.submit(flights.do, "ns", "key", lambda: "not called")
+        wait_for(lambda: coalesced(flights, "ns") == 1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="boom"):
+                future.result(5)
+    assert flights.do("ns", "key", lambda: "retried") == "retried"
+
+def test_do_many_computes_only_the_keys_nobody_has_in_flight():
+    flights, release, batches = SingleFlight(), threading.Event(), []
+
+    def compute(keys):
+        batches.append(list(keys))
+        if "a" in keys:
+            release.wait(5)
+        return [key.upper() for key in keys]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(flights.do_many, "ns", ["a", "b"], compute)
+        wait_for(lambda: batches)
+        second = executor.submit(flights.do_many, "ns", ["b", "c", "c"], compute)
+        wait_for(lambda: len(batches) == 2)
+        assert not second.done()
+        release.set()
+        assert first.result(5) == ["A", "B"]
+        assert second.result(5) == ["B", "C", "C"]
+    assert batches == [["a", "b"], ["c"]]
+
+def test_do_many_fails_the_waiters_of_a_failed_batch():
+    flights, release = SingleFlight(), threading.Event()
+
+    def fail(keys):
+        release.wait(5)
+        raise ConnectionError("down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(flights.do_many, "ns", ["a"], fail)
+        wait_for(lambda: flights.stats().get("ns", {}).get("in_flight") == 1)
+        follower = executor.submit(flights.do_many, "ns", ["a"], lambda keys: ["unused"])
+        wait_for(lambda: coalesced(flights, "ns") == 1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(ConnectionError):
+                future.result(5)
+    assert flights.stats()["ns"]["in_flight"] == 0
+
+def test_do_iter_replays_the_stream_to_callers_that_joined_in_flight():
+    flights, release = SingleFlight(), threading.Event()
+
+    def stream():
+        yield "first"
+        release.wait(5)
+        yield "second"
+
+    leader = flights.do_iter("ns", "key", stream)
+    assert next(leader) == "first"
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        follower = executor.submit(lambda: list(flights.do_iter("ns", "key", stream)))
+        wait_for(lambda: coalesced(flights, "ns") == 1)
+        release.set()
+        assert list(leader) == ["second"]
+        assert follower.result(5) == ["first", "second"]
+
+def test_do_iter_fails_the_followers_when_the_leader_stops_reading():
+    flights = SingleFlight()
+    leader = flights.do_iter("ns", "key", lambda: iter(["first", "second"]))
+    assert next(leader) == "first"
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        follower = executor.submit(lambda: list(flights.do_iter("ns", "key", lambda: iter(["unused"]))))
+        wait_for(lambda: coalesced(flights, "ns") == 1)
+        leader.close()
+        with pytest.raises(RuntimeError, match="closed"):
+            follower.result(5)